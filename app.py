@@ -12,18 +12,55 @@ Setup Instructions:
 The server will start on http://localhost:5000
 """
 
-from flask import Flask, jsonify, request
+from flask import Flask, Response, g, has_request_context, jsonify, make_response, request, send_file
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 import pandas as pd
 import numpy as np
 from pathlib import Path
 import pickle
-from functools import lru_cache
+import joblib
+from collections import Counter, OrderedDict, defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from functools import reduce, wraps
+import bisect
+import gzip
 import hashlib
+import io
+import itertools
+import base64
+import json
+import math
+import mmap
+import multiprocessing
 import jwt
 import datetime
 from werkzeug.utils import secure_filename
 import os
+import re
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+import zlib
+
+try:
+    import brotli  # Optional: enables Content-Encoding: br
+except ImportError:
+    brotli = None
+
+try:
+    import orjson  # Optional: fast JSON encoding with native NumPy array support
+except ImportError:
+    orjson = None
+
+try:
+    import fcntl  # Optional: locks datasets across worker processes (not available on Windows)
+except ImportError:
+    fcntl = None
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
@@ -36,12 +73,280 @@ def health():
 DATA_PATH = Path(__file__).parent / 'data' / 'mobile_usage.csv'
 MODEL_PATH = Path(__file__).parent / 'models'
 UPLOAD_FOLDER = Path(__file__).parent / 'uploads'
+REGISTRY_PATH = Path(os.environ.get('REGISTRY_PATH', Path(__file__).parent / 'data' / 'registry.sqlite3'))
 SECRET_KEY = 'your-secret-key-change-in-production'
+ADMIN_EMAILS = {email.strip().lower() for email in os.environ.get('ADMIN_EMAILS', '').split(',') if email.strip()}  # May train and activate models
 ALLOWED_EXTENSIONS = {'csv'}
+ANALYTICS_CACHE_VERSIONS = 8  # Number of dataset versions kept in the analytics cache
+DATASET_CACHE_BYTES = int(os.environ.get('DATASET_CACHE_BYTES', 512 * 1024 * 1024))  # Memory budget for parsed datasets
+TOKEN_CACHE_SIZE = 10000  # Verified tokens kept per worker
+TOKEN_CACHE_TTL = 60  # Seconds a verified token is trusted before it is checked again
+USERS_PAGE_MAX = 10000  # Largest page size accepted by /api/users
+STREAM_BATCH_ROWS = 5000  # Rows serialized per batch when building or streaming records
+INSIGHTS_BATCH_MAX = 100000  # Most user IDs accepted by one bulk insights request
+PREDICT_BATCH_MAX = 1000000  # Most records scored by one batch prediction request
+SWEEP_MAX_CELLS = 5000000  # Most user x scenario combinations evaluated by one sweep
+SWEEP_MAX_USER_ROWS = 10000  # Most users whose individual outcomes a sweep returns
+CUBE_MAX_CELLS = 1000000  # Largest data cube (product of dimension sizes) built for a dataset
+CACHE_CONTROL = 'private, no-cache'  # Clients keep responses but revalidate them with If-None-Match
+ETAG_SALT = str(os.stat(__file__).st_mtime_ns)  # Deploying new code changes every ETag
+COMPRESS_MIN_BYTES = 1024  # Smaller responses are sent uncompressed
+COMPRESS_LEVEL = 6  # gzip level (brotli uses quality 5)
+COMPRESS_MIMETYPES = {'application/json', 'application/x-ndjson', 'text/csv', 'text/plain'}
+MODEL_MMAP = True  # Memory-map model arrays on load so workers share them
+MODEL_LATENCY_SAMPLES = 1000  # Recent inference timings kept per model version
+QUANTILE_SKETCH_K = int(os.environ.get('QUANTILE_SKETCH_K', 200))  # Sketch size; rank error is about 1.3% at 200
+COLUMNAR_DIRNAME = '.columnar'  # Folder next to each dataset holding its memory-mapped columnar copy
+COLUMNAR_FORMAT = 2  # Bumped when the columnar layout changes; older copies are rebuilt on first use
+FLOAT32_DIGITS = 7  # Significant digits float32 columns are read back with
+INGEST_CHUNK_ROWS = 100000  # Rows parsed and validated per chunk during CSV ingest
+INGEST_HEADER_ROWS = 1000  # Size of the first chunk, used to validate the header quickly
+MAX_UPLOAD_BYTES = int(os.environ.get('MAX_UPLOAD_BYTES', 2 * 1024 ** 3))
+MAX_UPLOAD_ROWS = int(os.environ.get('MAX_UPLOAD_ROWS', 50000000))
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_BYTES + 1024 * 1024  # Headroom for multipart framing
+MAX_REPORTED_ERRORS = 50  # Type errors collected before ingest stops reading a file
+APPEND_MAX_ROWS = 100000  # Most rows accepted by one append request
+METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)  # Latency histogram bounds, seconds
+PROFILE_ENABLED = os.environ.get('PROFILE_ENABLED') == '1'  # Let clients sample a request with `X-Profile: 1`
+PROFILE_SLOW_MS = float(os.environ.get('PROFILE_SLOW_MS', 0))  # Sample every request, keep profiles of slower ones (0: off)
+PROFILE_INTERVAL = 0.005  # Seconds between stack samples
+PROFILE_DIR = Path(os.environ.get('PROFILE_DIR', Path(__file__).parent / 'profiles'))
+AGGREGATE_CHUNK_ROWS = int(os.environ.get('AGGREGATE_CHUNK_ROWS', 1000000))  # Rows per partial aggregate
+AGGREGATE_WORKERS = int(os.environ.get('AGGREGATE_WORKERS', os.cpu_count() or 1))  # Processes building partials (1: in-process)
+JOBS_DIR = Path(os.environ.get('JOBS_DIR', Path(__file__).parent / 'jobs'))
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', os.cpu_count() or 1))  # Processes running background jobs, per worker
+JOB_QUEUE_MAX = int(os.environ.get('JOB_QUEUE_MAX', 32))  # Jobs queued or running per worker before submissions are refused
+JOB_RETENTION = 24 * 3600  # Seconds a finished job and its result are kept on disk
+
+# Expected types of the mobile usage columns: 'int' must be a whole number on every
+# row, 'number' may be fractional or missing, 'str' is stored dictionary-encoded.
+# Other columns are typed from the first chunk of the file.
+COLUMN_TYPES = {
+    'User_ID': 'int',
+    'Device_Model': 'str',
+    'Operating_System': 'str',
+    'App_Usage_Time': 'number',
+    'Screen_On_Time': 'number',
+    'Battery_Drain': 'number',
+    'Number_of_Apps_Installed': 'int',
+    'Data_Usage': 'number',
+    'Age': 'int',
+    'Gender': 'str',
+    'User_Behavior_Class': 'int',
+}
+REQUIRED_COLUMNS = list(COLUMN_TYPES)  # Uploads need every column the analytics read
+
+# Storage dtype of the mobile usage columns in the columnar copy. Ingest widens a
+# column that does not fit, e.g. fractional values in an int16 column or decimals
+# float32 cannot hold; other columns get the smallest dtype their values fit.
+COLUMN_DTYPES = {
+    'User_ID': np.int32,
+    'App_Usage_Time': np.int16,
+    'Screen_On_Time': np.float32,
+    'Battery_Drain': np.int16,
+    'Number_of_Apps_Installed': np.int16,
+    'Data_Usage': np.int16,
+    'Age': np.int16,
+    'User_Behavior_Class': np.uint8,
+}
+
+# ============ JSON Serialization ============
+
+def json_default(obj):
+    """Encode NumPy and pandas values that the JSON encoders don't handle natively"""
+    if isinstance(obj, np.generic):
+        return replace_non_finite(obj.item())
+    if isinstance(obj, np.ndarray):
+        return replace_non_finite(obj.tolist())
+    if isinstance(obj, (pd.Series, pd.Index, pd.Categorical)):
+        return replace_non_finite(np.asarray(obj).tolist())
+    return DefaultJSONProvider.default(obj)
+
+def replace_non_finite(obj):
+    """Copy of a JSON value with NaN and infinities replaced by None, as orjson writes them"""
+    if isinstance(obj, float):
+        return obj if math.isfinite(obj) else None
+    if isinstance(obj, dict):
+        return {key: replace_non_finite(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [replace_non_finite(value) for value in obj]
+    return obj
+
+class NumpyJSONProvider(DefaultJSONProvider):
+    """JSON provider that accepts NumPy arrays and scalars anywhere in a response.
+
+    With orjson installed, numeric arrays are encoded straight from their
+    buffers without creating a Python object per value, and NaN is written
+    as null. Without it, values fall back to the standard library encoder,
+    with NaN and infinities replaced by null first so the output stays JSON.
+    """
+
+    default = staticmethod(json_default)
+
+    def _options(self, indent=None):
+        option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return option
+
+    def dumps(self, obj, **kwargs):
+        with timed_phase('serialize'):
+            if orjson is None or set(kwargs) - {'indent', 'separators'}:
+                return super().dumps(replace_non_finite(obj), **kwargs)
+            return orjson.dumps(obj, default=json_default, option=self._options(kwargs.get('indent'))).decode()
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        if orjson is None:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        with timed_phase('serialize'):
+            body = orjson.dumps(obj, default=json_default, option=self._options(indent))
+        return self._app.response_class(body + b'\n', mimetype=self.mimetype)
+
+app.json = NumpyJSONProvider(app)
+
+def ndjson_lines(rows):
+    """Encode row dicts as newline-delimited JSON, keeping each row's key order"""
+    if orjson is not None:
+        option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS | orjson.OPT_APPEND_NEWLINE
+        return b''.join(orjson.dumps(row, default=json_default, option=option) for row in rows)
+    return ''.join(json.dumps(replace_non_finite(row), default=json_default) + '\n' for row in rows).encode()
+
+# ============ User Registry ============
+
+REGISTRY_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    email TEXT NOT NULL UNIQUE,
+    password_hash TEXT NOT NULL,
+    created_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS revoked_tokens (
+    token_hash TEXT PRIMARY KEY,
+    expires_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS datasets (
+    user_id INTEGER PRIMARY KEY REFERENCES users (id),
+    path TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    rows INTEGER NOT NULL,
+    columns TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+'''
+
+class Registry:
+    """Users and their uploaded datasets in an SQLite database shared by all workers.
+
+    The database runs in WAL mode, so readers never block the writer and
+    every worker process sees registrations and uploads made by the others.
+    Each thread gets its own connection, reopened after a fork. Emails are
+    unique-indexed and user IDs come from the database, not a counter.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA foreign_keys=ON')
+            conn.executescript(REGISTRY_SCHEMA)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def create_user(self, name, email, password_hash):
+        """Insert a user and return it, or None if the email is already registered"""
+        try:
+            cursor = self._connection().execute(
+                'INSERT INTO users (name, email, password_hash, created_at) VALUES (?, ?, ?, ?)',
+                (name, email, password_hash, datetime.datetime.utcnow().isoformat()),
+            )
+        except sqlite3.IntegrityError:
+            return None
+        return self.get_user(cursor.lastrowid)
+
+    def get_user(self, user_id):
+        """User dict by ID, or None"""
+        row = self._connection().execute(
+            'SELECT id, name, email, password_hash FROM users WHERE id = ?', (user_id,)
+        ).fetchone()
+        return dict(row) if row else None
 
-# In-memory user storage (use a database in production)
-users_db = {}
-user_datasets = {}  # Maps user_id to their uploaded dataset path
+    def find_user_by_email(self, email):
+        """User dict by email through the unique index, or None"""
+        row = self._connection().execute(
+            'SELECT id, name, email, password_hash FROM users WHERE email = ?', (email,)
+        ).fetchone()
+        return dict(row) if row else None
+
+    def revoke_token(self, token, expires_at):
+        """Reject a token on every worker until it expires"""
+        conn = self._connection()
+        conn.execute('DELETE FROM revoked_tokens WHERE expires_at < ?', (time.time(),))
+        conn.execute(
+            'INSERT OR REPLACE INTO revoked_tokens (token_hash, expires_at) VALUES (?, ?)',
+            (hashlib.sha256(token.encode()).hexdigest(), expires_at),
+        )
+
+    def is_token_revoked(self, token):
+        """Whether a token was revoked by a logout"""
+        row = self._connection().execute(
+            'SELECT 1 FROM revoked_tokens WHERE token_hash = ?', (hashlib.sha256(token.encode()).hexdigest(),)
+        ).fetchone()
+        return row is not None
+
+    def set_dataset(self, user_id, path, filename, rows, columns, digest):
+        """Record a user's uploaded dataset, replacing any previous one"""
+        self._connection().execute(
+            '''INSERT INTO datasets (user_id, path, filename, rows, columns, digest, updated_at)
+               VALUES (?, ?, ?, ?, ?, ?, ?)
+               ON CONFLICT (user_id) DO UPDATE SET path = excluded.path, filename = excluded.filename,
+                   rows = excluded.rows, columns = excluded.columns, digest = excluded.digest,
+                   updated_at = excluded.updated_at''',
+            (user_id, str(path), filename, rows, json.dumps(columns), digest,
+             datetime.datetime.utcnow().isoformat()),
+        )
+
+    def add_dataset_rows(self, user_id, rows):
+        """Count rows appended to a user's dataset"""
+        self._connection().execute(
+            'UPDATE datasets SET rows = rows + ?, updated_at = ? WHERE user_id = ?',
+            (rows, datetime.datetime.utcnow().isoformat(), user_id),
+        )
+
+    def get_dataset(self, user_id):
+        """Metadata of a user's uploaded dataset, or None"""
+        row = self._connection().execute('SELECT * FROM datasets WHERE user_id = ?', (user_id,)).fetchone()
+        if row is None:
+            return None
+        dataset = dict(row)
+        dataset['columns'] = json.loads(dataset['columns'])
+        return dataset
+
+    def dataset_path(self, user_id):
+        """Path of a user's uploaded dataset, or None"""
+        row = self._connection().execute('SELECT path FROM datasets WHERE user_id = ?', (user_id,)).fetchone()
+        return Path(row['path']) if row else None
+
+registry = Registry(REGISTRY_PATH)
 
 # ============ Helper Functions ============
 
@@ -57,63 +362,282 @@ def generate_token(user_id):
     """Generate JWT token"""
     payload = {
         'user_id': user_id,
-        'exp': datetime.datetime.utcnow() + datetime.timedelta(days=7)
+        'exp': datetime.datetime.utcnow() + datetime.timedelta(days=7),
+        'jti': uuid.uuid4().hex,  # Unique per token, so revoking one session leaves the others valid
     }
     return jwt.encode(payload, SECRET_KEY, algorithm='HS256')
 
-def verify_token(token):
-    """Verify JWT token and return user_id"""
+def decode_token(token):
+    """Verify a JWT token and return its payload, or None if invalid or expired"""
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=['HS256'])
-        return payload['user_id']
+        return jwt.decode(token, SECRET_KEY, algorithms=['HS256'])
     except jwt.ExpiredSignatureError:
         return None
     except jwt.InvalidTokenError:
         return None
 
-def get_user_from_token():
-    """Get user from Authorization header"""
+def verify_token(token):
+    """Verify JWT token and return user_id"""
+    payload = decode_token(token)
+    return payload['user_id'] if payload else None
+
+class TokenCache:
+    """LRU cache of verified bearer tokens and the users they belong to.
+
+    An entry is trusted until the token's own `exp` or for `ttl` seconds,
+    whichever comes first, so a logout on another worker takes effect
+    within `ttl`. Logouts on this worker invalidate the entry at once.
+    """
+
+    def __init__(self, max_entries=TOKEN_CACHE_SIZE, ttl=TOKEN_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()  # token -> (user, trusted until)
+        self._lock = threading.Lock()
+
+    def get(self, token):
+        """Return the cached user for a token, or None on a miss"""
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is not None and entry[1] <= time.time():
+                del self._entries[token]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(token)
+            return entry[0]
+
+    def put(self, token, user, expires_at):
+        """Cache a verified token's user until `expires_at` (epoch seconds) or the TTL"""
+        with self._lock:
+            self._entries[token] = (user, min(expires_at, time.time() + self.ttl))
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, token=None, user_id=None):
+        """Forget one token, every token of a user, or everything"""
+        with self._lock:
+            if token is None and user_id is None:
+                dropped = list(self._entries)
+            else:
+                dropped = [t for t, (user, _) in self._entries.items() if t == token or user['id'] == user_id]
+            for t in dropped:
+                del self._entries[t]
+            self.invalidations += len(dropped)
+
+    def stats(self):
+        """Hit/miss/expiry counters and current size"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'expirations': self.expirations,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl,
+            }
+
+token_cache = TokenCache()
+
+def bearer_token():
+    """Token from the Authorization header, or None"""
     auth_header = request.headers.get('Authorization')
     if not auth_header or not auth_header.startswith('Bearer '):
         return None
-    token = auth_header.split(' ')[1]
-    user_id = verify_token(token)
-    if user_id and user_id in users_db:
-        return users_db[user_id]
-    return None
+    return auth_header.split(' ')[1]
+
+def get_user_from_token():
+    """Get user from Authorization header"""
+    token = bearer_token()
+    if not token:
+        return None
+    user = token_cache.get(token)
+    if user is not None:
+        return user
+    payload = decode_token(token)
+    user_id = payload.get('user_id') if payload else None
+    if not user_id or not str(user_id).isdigit() or registry.is_token_revoked(token):
+        return None
+    user = registry.get_user(int(user_id))
+    if user:
+        token_cache.put(token, user, payload['exp'])
+    return user
+
+def is_admin(user):
+    """Whether a user may change state shared by every user, such as the active model"""
+    return user['email'].lower() in ADMIN_EMAILS
 
 def load_user_data(user_id=None):
     """Load data - user-specific if uploaded, otherwise default"""
-    if user_id and user_id in user_datasets:
-        return pd.read_csv(user_datasets[user_id])
-    return pd.read_csv(DATA_PATH)
+    path = registry.dataset_path(int(user_id)) if user_id else None
+    if path is not None:
+        return dataset_cache.get(dataset_version(path))
+    return load_data()
 
-@lru_cache(maxsize=1)
 def load_data():
-    """Load and cache the mobile usage data"""
-    df = pd.read_csv(DATA_PATH)
-    return df
+    """Load the default mobile usage data through the dataset cache"""
+    return dataset_cache.get(dataset_version(DATA_PATH))
+
+def resolve_dataset_path():
+    """Return the calling user's uploaded dataset path, or the default dataset"""
+    user = get_user_from_token()
+    path = registry.dataset_path(user['id']) if user else None
+    return path if path is not None else DATA_PATH
+
+def current_dataset_version():
+    """Version of the dataset the current request should be served from"""
+    if 'dataset_version' in g:
+        return g.dataset_version  # Background jobs stay on the version they were submitted for
+    return dataset_version(resolve_dataset_path())
+
+def resolve_dataset():
+    """Resolve the caller's dataset to its (version, DataFrame) pair"""
+    version = current_dataset_version()
+    return version, dataset_cache.get(version)
+
+def dataset_version(path):
+    """Identify a dataset file by its path, modification time and size"""
+    stat = os.stat(path)
+    return (str(path), stat.st_mtime_ns, stat.st_size)
+
+class DatasetCache:
+    """LRU cache of parsed datasets bounded by a memory budget.
+
+    Files are identified by dataset_version() and parsed frames are stored by
+    content hash, so identical uploads from different users share one frame.
+    The most recently used frame is always kept, even if it exceeds the budget.
+    """
+
+    def __init__(self, max_bytes=DATASET_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._digests = {}  # version -> content digest
+        self._frames = OrderedDict()  # content digest -> (DataFrame, size in bytes)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, version):
+        """Return the parsed DataFrame for a dataset version, loading it on a miss"""
+        with timed_phase('load'):
+            df = self._get(version)
+        if has_request_context():
+            g.dataset_rows = len(df)
+        return df
+
+    def _get(self, version):
+        with self._lock:
+            digest = self._digests.get(version)
+            if digest in self._frames:
+                self.hits += 1
+                self._frames.move_to_end(digest)
+                return self._frames[digest][0]
+            self.misses += 1
 
-def get_aggregated_stats(df):
-    """Calculate aggregated statistics from the dataframe"""
+        path = version[0]
+        meta = ensure_columnar(version)
+        digest = meta['digest']
+        with self._lock:
+            cached = self._frames.get(digest)
+        df = cached[0] if cached else load_columnar(columnar_dir(version), meta)
+
+        with self._lock:
+            if digest not in self._frames:
+                size = int(df.memory_usage(deep=True).sum())
+                self._frames[digest] = (df, size)
+                self._bytes += size
+            self._frames.move_to_end(digest)
+            # Forget older versions of the same file
+            for stale in [v for v in self._digests if v[0] == path and v != version]:
+                del self._digests[stale]
+            self._digests[version] = digest
+            self._evict()
+            return self._frames[digest][0]
+
+    def _evict(self):
+        while self._bytes > self.max_bytes and len(self._frames) > 1:
+            digest, (_, size) = self._frames.popitem(last=False)
+            self._bytes -= size
+            self.evictions += 1
+            for version in [v for v, d in self._digests.items() if d == digest]:
+                del self._digests[version]
+
+    def stats(self):
+        """Hit/miss/eviction counters and current memory use"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self._frames),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+            }
+
+    def memory(self):
+        """Bytes held by each cached dataset, with the dtype and size of every column"""
+        with self._lock:
+            frames = [(digest, df) for digest, (df, _) in self._frames.items()]
+            files = {}
+            for version, digest in self._digests.items():
+                files.setdefault(digest, []).append(Path(version[0]).name)
+        datasets = []
+        for digest, df in frames:
+            columns = {
+                col: {
+                    'dtype': str(df[col].dtype),
+                    'bytes': int(df[col].memory_usage(index=False, deep=True)),
+                    'mapped': is_memory_mapped(df[col]),
+                }
+                for col in df.columns
+            }
+            datasets.append({
+                'digest': digest,
+                'files': files.get(digest, []),
+                'rows': len(df),
+                'bytes': sum(column['bytes'] for column in columns.values()),
+                'mapped_bytes': sum(column['bytes'] for column in columns.values() if column['mapped']),
+                'columns': columns,
+            })
+        return datasets
+
+def is_memory_mapped(series):
+    """Whether a column's values (or categorical codes) live in a memory-mapped file"""
+    values = series.array
+    base = np.asarray(values.codes if isinstance(values, pd.Categorical) else values)
+    while base is not None and not isinstance(base, (np.memmap, mmap.mmap)):
+        base = getattr(base, 'base', None)
+    return base is not None
+
+dataset_cache = DatasetCache()
+
+def get_aggregated_stats(aggregates):
+    """Build the dashboard statistics from the dataset's segment aggregates"""
     return {
-        'totalUsers': len(df),
-        'avgAppUsage': float(df['App_Usage_Time'].mean()),
-        'avgScreenTime': float(df['Screen_On_Time'].mean()),
-        'avgBatteryDrain': float(df['Battery_Drain'].mean()),
-        'avgDataUsage': float(df['Data_Usage'].mean()),
-        'avgAppsInstalled': float(df['Number_of_Apps_Installed'].mean()),
-        'deviceCounts': df['Device_Model'].value_counts().to_dict(),
-        'osCounts': df['Operating_System'].value_counts().to_dict(),
-        'behaviorCounts': df['User_Behavior_Class'].value_counts().to_dict(),
-        'ageGroups': {
-            '18-24': len(df[(df['Age'] >= 18) & (df['Age'] <= 24)]),
-            '25-34': len(df[(df['Age'] >= 25) & (df['Age'] <= 34)]),
-            '35-44': len(df[(df['Age'] >= 35) & (df['Age'] <= 44)]),
-            '45-54': len(df[(df['Age'] >= 45) & (df['Age'] <= 54)]),
-            '55+': len(df[df['Age'] >= 55]),
-        },
-        'genderCounts': df['Gender'].value_counts().to_dict(),
+        'totalUsers': aggregates.rows,
+        'avgAppUsage': aggregates.column_mean('App_Usage_Time'),
+        'avgScreenTime': aggregates.column_mean('Screen_On_Time'),
+        'avgBatteryDrain': aggregates.column_mean('Battery_Drain'),
+        'avgDataUsage': aggregates.column_mean('Data_Usage'),
+        'avgAppsInstalled': aggregates.column_mean('Number_of_Apps_Installed'),
+        'deviceCounts': aggregates.value_counts('Device_Model'),
+        'osCounts': aggregates.value_counts('Operating_System'),
+        'behaviorCounts': aggregates.value_counts('User_Behavior_Class'),
+        'ageGroups': dict(aggregates.age_groups),
+        'genderCounts': aggregates.value_counts('Gender'),
     }
 
 def success_response(data, message=None):
@@ -123,13 +647,1402 @@ def success_response(data, message=None):
         response['message'] = message
     return jsonify(response)
 
-def error_response(message, status_code=400, code=None):
+def error_response(message, status_code=400, code=None, details=None):
     """Standard error response format"""
     response = {'success': False, 'message': message}
     if code:
         response['code'] = code
+    if details:
+        response['details'] = details
     return jsonify(response), status_code
 
+# ============ Metrics ============
+
+# Request phases timed separately; 'compute' is whatever the others leave of the total
+REQUEST_PHASES = ['load', 'compute', 'serialize', 'compress']
+
+@contextmanager
+def timed_phase(phase):
+    """Add the time spent in the block to the current request's `phase` total"""
+    if not has_request_context():
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        phases = g.setdefault('phases', defaultdict(float))
+        phases[phase] += time.perf_counter() - start
+
+def prometheus_labels(**labels):
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for v in labels.values())
+    return '{' + ','.join(f'{key}="{value}"' for key, value in zip(labels, escaped)) + '}'
+
+class RequestMetrics:
+    """Per-route request counters, latency histograms and phase timings of this worker process"""
+
+    def __init__(self, buckets=METRICS_BUCKETS):
+        self.buckets = buckets
+        self._requests = defaultdict(int)  # (route, method, status) -> requests
+        self._latency = {}  # (route, method) -> observations per bucket, the last one being +Inf
+        self._latency_sum = defaultdict(float)  # (route, method) -> total seconds
+        self._phases = defaultdict(float)  # (route, phase) -> total seconds
+        self._bytes = defaultdict(int)  # route -> total response bytes
+        self._last_bytes = {}  # route -> size of the latest response
+        self._last_rows = {}  # route -> rows in the dataset the latest request read
+        self._lock = threading.Lock()
+
+    def observe(self, route, method, status, seconds, phases, size=None, rows=None):
+        """Record one finished request"""
+        with self._lock:
+            self._requests[(route, method, status)] += 1
+            counts = self._latency.setdefault((route, method), [0] * (len(self.buckets) + 1))
+            counts[bisect.bisect_left(self.buckets, seconds)] += 1
+            self._latency_sum[(route, method)] += seconds
+            for phase, spent in phases.items():
+                self._phases[(route, phase)] += spent
+            if size is not None:
+                self._bytes[route] += size
+                self._last_bytes[route] = size
+            if rows is not None:
+                self._last_rows[route] = rows
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+
+        def family(name, kind, description, samples):
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} {kind}')
+            lines.extend(f'{sample} {value}' for sample, value in samples)
+
+        with self._lock:
+            latency = []
+            for (route, method), counts in sorted(self._latency.items()):
+                cumulative = 0
+                for bound, count in zip([*self.buckets, '+Inf'], counts):
+                    cumulative += count
+                    latency.append(('app_request_duration_seconds_bucket'
+                                    + prometheus_labels(route=route, method=method, le=bound), cumulative))
+                latency.append(('app_request_duration_seconds_sum' + prometheus_labels(route=route, method=method),
+                                self._latency_sum[(route, method)]))
+                latency.append(('app_request_duration_seconds_count' + prometheus_labels(route=route, method=method),
+                                cumulative))
+            family('app_requests_total', 'counter', 'Requests handled, by route, method and status',
+                   [('app_requests_total' + prometheus_labels(route=r, method=m, status=s), n)
+                    for (r, m, s), n in sorted(self._requests.items())])
+            family('app_request_duration_seconds', 'histogram', 'Request latency up to the first response byte',
+                   latency)
+            family('app_request_phase_seconds_total', 'counter', 'Time spent in each request phase',
+                   [('app_request_phase_seconds_total' + prometheus_labels(route=r, phase=p), v)
+                    for (r, p), v in sorted(self._phases.items())])
+            family('app_response_bytes_total', 'counter', 'Response body bytes sent, after compression',
+                   [('app_response_bytes_total' + prometheus_labels(route=r), v) for r, v in sorted(self._bytes.items())])
+            family('app_response_bytes', 'gauge', 'Body size of the latest response',
+                   [('app_response_bytes' + prometheus_labels(route=r), v) for r, v in sorted(self._last_bytes.items())])
+            family('app_dataset_rows', 'gauge', 'Rows in the dataset the latest request read',
+                   [('app_dataset_rows' + prometheus_labels(route=r), v) for r, v in sorted(self._last_rows.items())])
+
+        datasets = dataset_cache.stats()
+        family('app_dataset_cache_bytes', 'gauge', 'Bytes held by cached datasets', [('app_dataset_cache_bytes', datasets['bytes'])])
+        family('app_dataset_cache_entries', 'gauge', 'Datasets in the cache', [('app_dataset_cache_entries', datasets['entries'])])
+        family('app_dataset_cache_requests_total', 'counter', 'Dataset cache lookups by result',
+               [('app_dataset_cache_requests_total' + prometheus_labels(result=key), datasets[key])
+                for key in ('hits', 'misses')])
+        tokens = token_cache.stats()
+        family('app_token_cache_requests_total', 'counter', 'Token cache lookups by result',
+               [('app_token_cache_requests_total' + prometheus_labels(result=key), tokens[key])
+                for key in ('hits', 'misses')])
+        family('app_jobs_pending', 'gauge', 'Background jobs this worker has queued or running',
+               [('app_jobs_pending', job_queue.pending())])
+        return '\n'.join(lines) + '\n'
+
+request_metrics = RequestMetrics()
+
+class StackSampler:
+    """Samples one thread's Python stack at a fixed interval.
+
+    Stacks are counted in the folded format read by flamegraph.pl and
+    speedscope: one `outer;inner;leaf count` line per distinct stack.
+    """
+
+    def __init__(self, thread_id, interval=PROFILE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self.stacks
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(f'{frame.f_globals.get("__name__", "?")}:{frame.f_code.co_qualname}')
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def folded(self):
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+def save_profile(route, sampler):
+    """Write a sampled request's folded stacks to PROFILE_DIR; returns the file name"""
+    PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    slug = re.sub(r'[^A-Za-z0-9]+', '_', route).strip('_') or 'root'
+    name = f'{time.strftime("%Y%m%d-%H%M%S")}-{os.getpid()}-{uuid.uuid4().hex[:8]}-{slug}.folded'
+    (PROFILE_DIR / name).write_text(sampler.folded())
+    return name
+
+@app.before_request
+def start_request_metrics():
+    g.request_start = time.perf_counter()
+    g.phases = defaultdict(float)
+    if (PROFILE_ENABLED and request.headers.get('X-Profile') == '1') or PROFILE_SLOW_MS:
+        g.sampler = StackSampler(threading.get_ident()).start()
+
+@app.after_request
+def record_request_metrics(response):
+    """Time the request by phase, record it and keep its profile when one was asked for or it was slow.
+
+    Registered before compress_response, so it runs after it and sees the compressed size.
+    """
+    if 'request_start' not in g:
+        return response
+    elapsed = time.perf_counter() - g.request_start
+    phases = g.phases
+    phases['compute'] = max(elapsed - sum(phases.values()), 0.0)
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    size = None if response.is_streamed else response.content_length
+    request_metrics.observe(route, request.method, response.status_code, elapsed, phases, size, g.get('dataset_rows'))
+    response.headers['Server-Timing'] = ', '.join(
+        f'{phase};dur={phases[phase] * 1000:.1f}' for phase in REQUEST_PHASES if phase in phases
+    )
+
+    sampler = g.pop('sampler', None)
+    if sampler is not None:
+        sampler.stop()
+        requested = PROFILE_ENABLED and request.headers.get('X-Profile') == '1'
+        if requested or (PROFILE_SLOW_MS and elapsed * 1000 >= PROFILE_SLOW_MS):
+            response.headers['X-Profile-File'] = save_profile(route, sampler)
+    return response
+
+@app.teardown_request
+def stop_request_sampler(exc):
+    """Stop the stack sampler of a request that failed before after_request ran"""
+    sampler = g.pop('sampler', None)
+    if sampler is not None:
+        sampler.stop()
+
+# ============ HTTP Caching ============
+
+def dataset_etag(view):
+    """
+    Tag a dataset-backed GET endpoint with an ETag for conditional requests
+
+    The tag is derived from the caller's dataset version and the request's
+    path and query, so it changes whenever the data behind the response
+    does. A matching If-None-Match is answered with 304 before the view runs.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        query = sorted(request.args.items(multi=True))
+        tag = hashlib.sha1(
+            repr((ETAG_SALT, current_dataset_version(), request.path, query)).encode()
+        ).hexdigest()
+        if request.if_none_match.contains_weak(tag):
+            response = make_response('', 304)
+        else:
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+        # Weak, so the tag stays valid for gzip and brotli encodings of the same body
+        response.set_etag(tag, weak=True)
+        response.headers['Cache-Control'] = CACHE_CONTROL
+        response.vary.update(['Authorization', 'Accept-Encoding'])
+        return response
+    return wrapper
+
+def gzip_stream(chunks):
+    """Gzip a streamed body chunk by chunk"""
+    compressor = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, 31)  # wbits 31: gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode() if isinstance(chunk, str) else chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+@app.after_request
+def compress_response(response):
+    """Compress large JSON and text bodies with the best encoding the client accepts"""
+    if (response.status_code != 200 or response.direct_passthrough
+            or 'Content-Encoding' in response.headers or response.mimetype not in COMPRESS_MIMETYPES):
+        return response
+    response.vary.add('Accept-Encoding')
+    if response.is_streamed:
+        # Streamed bodies (ndjson exports) are gzipped on the fly
+        if request.accept_encodings.best_match(['gzip']):
+            response.response = gzip_stream(response.response)
+            response.headers['Content-Encoding'] = 'gzip'
+        return response
+    encoding = request.accept_encodings.best_match(['br', 'gzip'] if brotli else ['gzip'])
+    data = response.get_data()
+    if encoding is None or len(data) < COMPRESS_MIN_BYTES:
+        return response
+    with timed_phase('compress'):
+        if encoding == 'br':
+            response.set_data(brotli.compress(data, quality=5))
+        else:
+            response.set_data(gzip.compress(data, compresslevel=COMPRESS_LEVEL))
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+# ============ Columnar Storage ============
+
+def columnar_dir(version):
+    """Folder holding the columnar copy of one dataset version"""
+    path = Path(version[0])
+    return path.parent / COLUMNAR_DIRNAME / f'{path.name}-{version[1]}-{version[2]}'
+
+def load_columnar(directory, meta):
+    """Open a columnar dataset as a DataFrame backed by read-only memory maps.
+
+    Pages are shared through the OS page cache, so every worker process that
+    opens the same dataset version reads the same physical memory. Columns are
+    cut to `meta['rows']`, as an append may already have grown a shared file.
+    """
+    data = {}
+    for column in meta['columns']:
+        values = np.load(directory / column['file'], mmap_mode='r')[:meta['rows']]
+        if 'categories' in column:
+            values = pd.Categorical.from_codes(values, column['categories'], validate=False)
+        data[column['name']] = values
+    return pd.DataFrame(data, copy=False)
+
+def widen_float32(values):
+    """Convert float32 values to float64 at the decimals they were parsed from.
+
+    float32 holds about FLOAT32_DIGITS significant digits, so rounding to that
+    many reads a stored 6.4 back as 6.4 rather than 6.400000095367432.
+    """
+    wide = np.asarray(values, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        exponent = FLOAT32_DIGITS - 1 - np.floor(np.log10(np.abs(wide)))
+        exponent = np.where(np.isfinite(exponent), exponent, 0)
+        up = 10.0 ** np.maximum(exponent, 0)  # Exact powers of ten, so the division rounds correctly
+        down = 10.0 ** np.maximum(-exponent, 0)
+        rounded = np.where(exponent >= 0, np.rint(wide * up) / up, np.rint(wide / down) * down)
+    return np.where(np.isfinite(rounded), rounded, wide)
+
+def column_values(series, positions=None):
+    """A column's values as a NumPy array, optionally only at `positions`.
+
+    Categoricals are decoded to their labels and float32 columns widened with
+    widen_float32(), so callers see the values as they appeared in the CSV.
+    """
+    values = np.asarray(series.array if positions is None else series.array[positions])
+    return widen_float32(values) if values.dtype == np.float32 else values
+
+def category_code_dtype(count):
+    """The code width pandas picks for `count` categories, so mapped codes are used without a copy"""
+    return np.int8 if count < 127 else np.int16 if count < 32767 else np.int32
+
+def append_npy(path, values, rows):
+    """Write values after the first `rows` of a 1-d .npy file and grow the shape in its header.
+
+    Data is written before the header, so a reader never sees rows that are
+    not there yet; mappings of the old length stay valid. `rows` comes from the
+    columnar metadata rather than the header, which a failed append may have
+    grown. Returns False, without writing, when the header has no room for the
+    new shape.
+    """
+    with open(path, 'r+b') as f:
+        np.lib.format.read_magic(f)
+        _, _, dtype = np.lib.format.read_array_header_1_0(f)
+        offset = f.tell()
+        header = io.BytesIO()
+        np.lib.format.write_array_header_1_0(header, {
+            'descr': np.lib.format.dtype_to_descr(dtype),
+            'fortran_order': False,
+            'shape': (rows + len(values),),
+        })
+        if len(header.getvalue()) != offset:
+            return False
+        f.seek(offset + rows * dtype.itemsize)
+        f.write(np.ascontiguousarray(values, dtype=dtype).tobytes())
+        f.flush()
+        f.seek(0)
+        f.write(header.getvalue())
+    return True
+
+def extend_npy(source, path, values, rows):
+    """Hard-link a column file to `path` and append values after its first `rows`.
+
+    Returns False, leaving nothing at `path`, when the file has to be rewritten.
+    """
+    try:
+        os.link(source, path)
+    except OSError:
+        shutil.copyfile(source, path)  # File systems without hard links
+    if append_npy(path, values, rows):
+        return True
+    path.unlink()
+    return False
+
+def extend_columnar(version, batch_dir, batch_meta, target):
+    """
+    Write the columnar copy of a dataset version plus an ingested batch to `target`
+
+    Columns whose dtype holds the batch, and whose new categories sort after
+    the existing ones, are hard-linked from the version's folder and the batch
+    is written after its last row. Readers of the version only map its own
+    rows, so they are unaffected. Other columns are written out in full, so a
+    typical append costs O(batch). The caller publishes `target` under the
+    new version once the CSV has grown.
+    """
+    directory = columnar_dir(version)
+    with open(directory / 'meta.json') as f:
+        meta = json.load(f)
+    target.mkdir(parents=True)
+    rows = meta['rows']
+    columns = []
+    for column, batch_column in zip(meta['columns'], batch_meta['columns']):
+        source = directory / column['file']
+        path = target / column['file']
+        existing = np.load(source, mmap_mode='r')[:rows]
+        values = np.load(batch_dir / batch_column['file'])
+        column = dict(column)
+        if 'categories' in column:
+            known = set(column['categories'])
+            categories = sorted(column['categories'] + [v for v in batch_column['categories'] if v not in known], key=str)
+            codes = {value: code for code, value in enumerate(categories)}
+            remap = np.array([codes[v] for v in batch_column['categories']] + [-1], dtype=np.int64)
+            dtype = category_code_dtype(len(categories))
+            values = remap[values].astype(dtype)
+            in_place = (categories[:len(column['categories'])] == column['categories']
+                        and dtype == existing.dtype)
+            if not (in_place and extend_npy(source, path, values, rows)):
+                old = np.array([codes[v] for v in column['categories']] + [-1], dtype=np.int64)
+                np.save(path, np.concatenate([old[existing].astype(dtype), values]))
+            column['categories'] = categories
+        else:
+            dtype = np.result_type(existing.dtype, values.dtype)
+            if not (dtype == existing.dtype and extend_npy(source, path, values.astype(dtype), rows)):
+                # float32 values are widened at their parsed decimals, not their binary value
+                np.save(path, np.concatenate([
+                    (widen_float32(part) if part.dtype == np.float32 and dtype != np.float32 else part).astype(dtype)
+                    for part in (existing, values)
+                ]))
+        columns.append(column)
+
+    meta.update(
+        rows=rows + batch_meta['rows'],
+        digest=hashlib.sha256((meta['digest'] + batch_meta['digest']).encode()).hexdigest(),
+        columns=columns,
+    )
+    with open(target / 'meta.json', 'w') as f:
+        json.dump(meta, f)
+    return meta
+
+def staging_dir(path):
+    """Private folder a conversion of `path` is written to before being published"""
+    path = Path(path)
+    return path.parent / COLUMNAR_DIRNAME / f'{path.name}.tmp-{os.getpid()}-{threading.get_ident()}'
+
+def publish_columnar(staging, version):
+    """Atomically move a finished conversion into place for a dataset version.
+
+    Concurrent workers never observe a partially written dataset; if another
+    worker published the same version first, its copy is kept.
+    """
+    try:
+        os.rename(staging, columnar_dir(version))
+    except OSError:
+        shutil.rmtree(staging, ignore_errors=True)
+    remove_stale_columnar(version)
+
+def ensure_columnar(version):
+    """Return the columnar metadata for a dataset version, converting the CSV on first use"""
+    meta_path = columnar_dir(version) / 'meta.json'
+    if meta_path.exists():
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if meta.get('format') == COLUMNAR_FORMAT:
+            return meta
+        shutil.rmtree(columnar_dir(version), ignore_errors=True)  # Written by an older release
+    if not meta_path.exists():
+        staging = staging_dir(version[0])
+        shutil.rmtree(staging, ignore_errors=True)
+        try:
+            with open(version[0], 'rb') as f:
+                ingest_csv(f, staging, required_columns=())  # Checked when the file was uploaded
+        except Exception:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        publish_columnar(staging, version)
+    with open(meta_path) as f:
+        return json.load(f)
+
+def remove_stale_columnar(version):
+    """Delete columnar copies of older versions of the same dataset file"""
+    current = columnar_dir(version)
+    name = Path(version[0]).name
+    for candidate in current.parent.iterdir():
+        if candidate != current and '.tmp-' not in candidate.name and candidate.name.rsplit('-', 2)[0] == name:
+            # Workers still mapping the old files keep reading them until they let go
+            shutil.rmtree(candidate, ignore_errors=True)
+
+# ============ CSV Ingest ============
+
+class IngestError(Exception):
+    """A CSV file was rejected during ingest"""
+
+    def __init__(self, message, code, status_code=400, details=None):
+        super().__init__(message)
+        self.message = message
+        self.code = code
+        self.status_code = status_code
+        self.details = details
+
+class IngestReader:
+    """File-like wrapper that enforces a byte limit, hashes the bytes and optionally copies them"""
+
+    def __init__(self, stream, max_bytes=None, copy_to=None):
+        self.bytes_read = 0
+        self._stream = stream
+        self._max_bytes = max_bytes
+        self._copy_to = copy_to
+        self._digest = hashlib.sha256()
+
+    def read(self, size=-1):
+        data = self._stream.read(size)
+        self.bytes_read += len(data)
+        if self._max_bytes is not None and self.bytes_read > self._max_bytes:
+            raise IngestError(f'File exceeds the {self._max_bytes} byte limit', 'FILE_TOO_LARGE', 413)
+        self._digest.update(data)
+        if self._copy_to is not None:
+            self._copy_to.write(data)
+        return data
+
+    def hexdigest(self):
+        return self._digest.hexdigest()
+
+def infer_column_type(values):
+    """Type an unknown column as 'number' if every value in the sample parses as one"""
+    present = values.dropna()
+    if len(present) and pd.to_numeric(present, errors='coerce').notna().all():
+        return 'number'
+    return 'str'
+
+class ColumnSpill:
+    """Validates one column chunk by chunk and spills it to a raw file on disk"""
+
+    def __init__(self, directory, position, name, kind):
+        self.name = name
+        self.kind = kind
+        self.directory = directory
+        self.file = f'col_{position}.npy'
+        self._spill_path = directory / f'col_{position}.bin'
+        self._spill = open(self._spill_path, 'wb')
+        self._integral = True  # 'number' columns holding only whole values are stored as ints
+        self._float32 = True  # Fractional columns whose values all survive float32 are stored as float32
+        self._min = self._max = 0  # Range of the values seen so far, used to pick the int width
+        self._categories = {}  # 'str' columns: value -> code in order of first appearance
+
+    def append(self, values, row_offset):
+        """Validate and spill one chunk of string values; returns a list of type errors"""
+        if self.kind == 'str':
+            codes, uniques = pd.factorize(values)
+            mapping = np.array(
+                [self._categories.setdefault(value, len(self._categories)) for value in uniques] + [-1],
+                dtype=np.int32,
+            )
+            mapping[codes].tofile(self._spill)  # Missing values (-1) map to the trailing -1
+            return []
+
+        parsed = pd.to_numeric(values, errors='coerce')
+        numbers = parsed.to_numpy(dtype=float, na_value=np.nan)
+        present = values.notna().to_numpy()
+        bad = present & np.isnan(numbers)
+        if self.kind == 'int':
+            bad |= ~present | (np.isfinite(numbers) & (numbers != np.floor(numbers)))
+        if bad.any():
+            rows = np.flatnonzero(bad)[:MAX_REPORTED_ERRORS]
+            raw = values.to_numpy()[rows]
+            expected = 'integer' if self.kind == 'int' else 'number'
+            return [
+                {
+                    'row': int(row_offset + row + 1),
+                    'column': self.name,
+                    'value': None if pd.isna(value) else str(value),
+                    'expected': expected,
+                }
+                for row, value in zip(rows, raw)
+            ]
+
+        finite = numbers[np.isfinite(numbers)]
+        if len(finite):
+            self._min = min(self._min, finite.min())
+            self._max = max(self._max, finite.max())
+        if self.kind == 'int':
+            parsed.to_numpy(dtype=np.int64).tofile(self._spill)
+        else:
+            self._integral = self._integral and bool(np.all(numbers == np.floor(numbers)))
+            # Checked on whole-number chunks too, as a later fraction can turn the column float
+            if self._float32:
+                with np.errstate(over='ignore'):
+                    self._float32 = np.array_equal(widen_float32(finite.astype(np.float32)), finite)
+            numbers.tofile(self._spill)
+        return []
+
+    def storage_dtype(self, rows):
+        """Smallest dtype that holds the column exactly, preferring its COLUMN_DTYPES entry"""
+        if self.kind == 'str':
+            return category_code_dtype(len(self._categories))
+        if rows == 0:
+            return np.int64 if self.kind == 'int' else np.float64
+        if self.kind == 'number' and not self._integral:
+            return np.float32 if self._float32 else np.float64
+        declared = COLUMN_DTYPES.get(self.name)
+        candidates = [np.uint8, np.int8, np.uint16, np.int16, np.uint32, np.int32, np.int64]
+        if declared is not None and np.issubdtype(declared, np.integer):
+            candidates.insert(0, declared)
+        for dtype in candidates:
+            info = np.iinfo(dtype)
+            if info.min <= self._min and self._max <= info.max:
+                return dtype
+        return np.int64
+
+    def finish(self, rows):
+        """Turn the spill file into the column's .npy file; returns the column metadata"""
+        self._spill.close()
+        spill_dtype = {'int': np.int64, 'number': np.float64, 'str': np.int32}[self.kind]
+        dtype = self.storage_dtype(rows)
+        column = {'name': self.name, 'file': self.file}
+
+        remap = None
+        if self.kind == 'str':
+            # Store categories sorted, as pandas would, and renumber the codes to match
+            categories = sorted(self._categories, key=str)
+            remap = np.full(len(categories) + 1, -1, dtype=np.int32)
+            for code, value in enumerate(categories):
+                remap[self._categories[value]] = code
+            column['categories'] = categories
+
+        if rows == 0:
+            np.save(self.directory / self.file, np.empty(0, dtype=dtype))
+        else:
+            source = np.memmap(self._spill_path, dtype=spill_dtype, mode='r', shape=(rows,))
+            target = np.lib.format.open_memmap(self.directory / self.file, mode='w+', dtype=dtype, shape=(rows,))
+            for start in range(0, rows, INGEST_CHUNK_ROWS):
+                block = source[start:start + INGEST_CHUNK_ROWS]
+                target[start:start + len(block)] = remap[block] if remap is not None else block
+            target.flush()
+            del source, target
+        os.remove(self._spill_path)
+        return column
+
+def ingest_csv(stream, staging, copy_to=None, max_bytes=None, max_rows=None, column_types=None,
+               required_columns=REQUIRED_COLUMNS):
+    """Validate a CSV stream and convert it chunk by chunk into a columnar folder.
+
+    The header is checked for `required_columns` as soon as the first small
+    chunk is parsed, and values are checked against COLUMN_TYPES (or
+    `column_types`) with 1-based data row numbers. Only one chunk is held in
+    memory at a time. Returns the columnar metadata or raises IngestError.
+    """
+    reader = IngestReader(stream, max_bytes, copy_to)
+    staging.mkdir(parents=True)
+    try:
+        chunks = pd.read_csv(reader, iterator=True, dtype=str)
+    except pd.errors.EmptyDataError:
+        raise IngestError('File is empty', 'INVALID_CSV')
+    except (pd.errors.ParserError, UnicodeDecodeError) as e:
+        raise IngestError(f'Error processing CSV: {str(e)}', 'CSV_PARSE_ERROR')
+
+    spills = None
+    rows = 0
+    errors = []
+    try:
+        while len(errors) < MAX_REPORTED_ERRORS:
+            try:
+                chunk = chunks.get_chunk(INGEST_HEADER_ROWS if spills is None else INGEST_CHUNK_ROWS)
+            except StopIteration:
+                break
+            if spills is None:
+                missing = [col for col in required_columns if col not in chunk.columns]
+                if missing:
+                    raise IngestError(f'Missing required columns: {", ".join(missing)}', 'INVALID_CSV')
+                spills = [
+                    ColumnSpill(staging, i, name, (column_types or COLUMN_TYPES).get(name) or infer_column_type(chunk[name]))
+                    for i, name in enumerate(chunk.columns)
+                ]
+            if max_rows is not None and rows + len(chunk) > max_rows:
+                raise IngestError(f'File exceeds the {max_rows} row limit', 'TOO_MANY_ROWS', 413)
+            for spill in spills:
+                errors.extend(spill.append(chunk[spill.name], rows))
+            rows += len(chunk)
+    except (pd.errors.ParserError, UnicodeDecodeError) as e:
+        raise IngestError(f'Error processing CSV: {str(e)}', 'CSV_PARSE_ERROR')
+    finally:
+        chunks.close()
+
+    if errors:
+        raise IngestError(
+            f'Found invalid values in {len({e["column"] for e in errors})} column(s)',
+            'INVALID_CSV_TYPES',
+            details=errors[:MAX_REPORTED_ERRORS],
+        )
+    if spills is None:
+        raise IngestError('File has no header row', 'INVALID_CSV')
+
+    meta = {
+        'format': COLUMNAR_FORMAT,
+        'rows': rows,
+        'digest': reader.hexdigest(),
+        'columns': [spill.finish(rows) for spill in spills],
+    }
+    with open(staging / 'meta.json', 'w') as f:
+        json.dump(meta, f)
+    return meta
+
+# ============ Segment Aggregates ============
+
+# Numeric columns summarized dataset-wide and per segment
+AGGREGATE_COLUMNS = ['App_Usage_Time', 'Screen_On_Time', 'Battery_Drain',
+                     'Number_of_Apps_Installed', 'Data_Usage', 'Age', 'User_Behavior_Class']
+# Segment columns: counts and per-column sums are kept for each value
+SEGMENT_COLUMNS = ['User_Behavior_Class', 'Device_Model', 'Operating_System', 'Gender']
+# Segment pairs whose joint counts are kept (dominant OS and gender mix per class)
+SEGMENT_CROSSES = [('User_Behavior_Class', 'Operating_System'), ('User_Behavior_Class', 'Gender')]
+# Age group label -> inclusive (low, high) bounds
+AGE_GROUPS = {
+    '18-24': (18, 24),
+    '25-34': (25, 34),
+    '35-44': (35, 44),
+    '45-54': (45, 54),
+    '55+': (55, np.inf),
+}
+
+def segment_codes(values):
+    """Integer codes and labels of a segment column, -1 for missing values"""
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return values.cat.codes.to_numpy(), values.cat.categories.tolist()
+    codes, labels = pd.factorize(values)
+    return codes, labels.tolist()
+
+def age_group_codes(ages):
+    """Index of each age's AGE_GROUPS bucket, -1 outside every bucket or missing"""
+    bounds = np.array(list(AGE_GROUPS.values()), dtype=float)
+    group = np.searchsorted(bounds[:, 0], ages, side='right') - 1
+    within = (group >= 0) & (ages <= bounds[group.clip(0), 1])
+    return np.where(within, group, -1)
+
+def align_labels(labels, other):
+    """Union of two label lists and the position of each side's labels in it"""
+    union = list(dict.fromkeys([*labels, *other]))
+    position = {label: i for i, label in enumerate(union)}
+    return union, [position[label] for label in labels], [position[label] for label in other]
+
+class QuantileSketch:
+    """KLL quantile sketch of a numeric column.
+
+    Keeps O(k log(n / k)) values in levels of compactors, where a value at
+    level h stands for 2**h rows. Ranks and quantiles are answered from the
+    retained values with a normalized rank error of about 2.3 / k**0.97.
+    Sketches of disjoint row sets merge into a sketch of their union with
+    the same error bound. Missing values are skipped.
+    """
+
+    def __init__(self, k=QUANTILE_SKETCH_K):
+        self.k = k
+        self.count = 0
+        self.levels = [np.empty(0)]
+        self._rng = np.random.default_rng(0)
+        self._weighted = None  # (sorted values, cumulative weights), built on first query
+
+    @property
+    def rank_error(self):
+        """Normalized rank error of single rank or quantile queries"""
+        return 2.296 / self.k ** 0.9723
+
+    def update(self, values):
+        """Add a batch of values"""
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        if len(values):
+            self.count += len(values)
+            self.levels[0] = np.concatenate([self.levels[0], values])
+            self._compress()
+
+    def merge(self, other):
+        """Sketch of the union of two disjoint row sets"""
+        merged = QuantileSketch(max(self.k, other.k))
+        merged.count = self.count + other.count
+        size = max(len(self.levels), len(other.levels))
+        merged.levels = [
+            np.concatenate([levels[h] for levels in (self.levels, other.levels) if h < len(levels)])
+            for h in range(size)
+        ]
+        merged._compress()
+        return merged
+
+    def _capacity(self, level):
+        # Lower levels get geometrically smaller compactors, the top level gets k
+        return max(int(np.ceil(self.k * (2 / 3) ** (len(self.levels) - level - 1))), 2)
+
+    def _compress(self):
+        self._weighted = None
+        # Compact the lowest full level until the sketch fits its total capacity
+        while sum(map(len, self.levels)) > sum(self._capacity(h) for h in range(len(self.levels))):
+            level = next(h for h, items in enumerate(self.levels) if len(items) >= self._capacity(h))
+            if level + 1 == len(self.levels):
+                self.levels.append(np.empty(0))
+            items = np.sort(self.levels[level])
+            # An odd item out stays behind; every other remaining item moves up with double weight
+            keep = len(items) % 2
+            promoted = items[keep:][self._rng.integers(2)::2]
+            self.levels[level] = items[:keep]
+            self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+
+    def _weighted_values(self):
+        if self._weighted is None:
+            values = np.concatenate(self.levels)
+            weights = np.concatenate([np.full(len(items), 2.0 ** h) for h, items in enumerate(self.levels)])
+            order = np.argsort(values, kind='stable')
+            self._weighted = (values[order], np.cumsum(weights[order]))
+        return self._weighted
+
+    def rank(self, values):
+        """Estimated number of values <= each of `values`"""
+        sorted_values, cumulative = self._weighted_values()
+        position = np.searchsorted(sorted_values, np.asarray(values, dtype=float), side='right')
+        return np.where(position > 0, cumulative[np.maximum(position - 1, 0)], 0.0) if len(sorted_values) \
+            else np.zeros(np.shape(values))
+
+    def quantile(self, q):
+        """Estimated value at quantile q (a float or array in [0, 1]), NaN for an empty sketch"""
+        sorted_values, cumulative = self._weighted_values()
+        if not len(sorted_values):
+            return np.full(np.shape(q), np.nan) if np.ndim(q) else float('nan')
+        position = np.searchsorted(cumulative, np.asarray(q, dtype=float) * self.count, side='left')
+        result = sorted_values[np.minimum(position, len(sorted_values) - 1)]
+        return result if np.ndim(q) else float(result)
+
+def build_sketches(values):
+    """One QuantileSketch per aggregate column of a (rows x columns) value block"""
+    sketches = {}
+    for i, col in enumerate(AGGREGATE_COLUMNS):
+        sketches[col] = QuantileSketch()
+        sketches[col].update(values[:, i])
+    return sketches
+
+def merge_sketches(mine, theirs):
+    """Merge two column -> QuantileSketch dicts, either of which may be None"""
+    if mine is None or theirs is None:
+        return mine or theirs
+    return {col: mine[col].merge(theirs[col]) for col in AGGREGATE_COLUMNS}
+
+class SegmentAggregates:
+    """Counts, sums, co-moments and quantile sketches behind the stats and role insights.
+
+    Everything is computed in one vectorized pass over the columns: segment
+    values are integer-coded and every per-segment count and sum is a bincount.
+    Aggregates of two disjoint row sets combine exactly with `merge`, using
+    Chan's update for the means and co-moments; the sketches merge with
+    their usual error bound.
+    """
+
+    def __init__(self):
+        size = len(AGGREGATE_COLUMNS)
+        self.rows = 0
+        # Per column, skipping missing values: count, mean, sum of squared deviations, extremes
+        self.count = np.zeros(size)
+        self.mean = np.zeros(size)
+        self.m2 = np.zeros(size)
+        self.min = np.full(size, np.inf)
+        self.max = np.full(size, -np.inf)
+        # Rows with every column present: count, mean vector and co-moment matrix
+        self.complete = 0
+        self.complete_mean = np.zeros(size)
+        self.comoment = np.zeros((size, size))
+        # Segment column -> {'labels', 'rows', 'count' (labels x columns), 'sum' (labels x columns)}
+        self.segments = {
+            col: {
+                'labels': [], 'rows': np.zeros(0), 'count': np.zeros((0, size)), 'sum': np.zeros((0, size)),
+                'sketches': [],
+            }
+            for col in SEGMENT_COLUMNS
+        }
+        # (column, column) -> {'labels' (left, right), 'rows' (left x right)}
+        self.crosses = {pair: {'labels': ([], []), 'rows': np.zeros((0, 0))} for pair in SEGMENT_CROSSES}
+        self.age_groups = dict.fromkeys(AGE_GROUPS, 0)
+        # Column -> QuantileSketch over every row; segments also hold one dict per value under 'sketches'
+        self.sketches = build_sketches(np.empty((0, size)))
+
+    @classmethod
+    def from_frame(cls, df, sketches=True):
+        """Aggregate a data frame; `sketches=False` skips the quantile sketches for one-off subsets"""
+        aggregates = cls()
+        values = np.column_stack([column_values(df[col]).astype(float) for col in AGGREGATE_COLUMNS]) \
+            if len(df) else np.empty((0, len(AGGREGATE_COLUMNS)))
+        present = ~np.isnan(values)
+        filled = np.where(present, values, 0.0)
+
+        aggregates.rows = len(df)
+        aggregates.count = present.sum(axis=0).astype(float)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            aggregates.mean = filled.sum(axis=0) / aggregates.count
+        aggregates.mean = np.nan_to_num(aggregates.mean)
+        aggregates.m2 = (np.where(present, values - aggregates.mean, 0.0) ** 2).sum(axis=0)
+        if len(df):
+            aggregates.min = np.where(present, values, np.inf).min(axis=0)
+            aggregates.max = np.where(present, values, -np.inf).max(axis=0)
+
+        complete = present.all(axis=1)
+        aggregates.complete = int(complete.sum())
+        if aggregates.complete:
+            centered = values[complete] - values[complete].mean(axis=0)
+            aggregates.complete_mean = values[complete].mean(axis=0)
+            aggregates.comoment = centered.T @ centered
+
+        if sketches:
+            aggregates.sketches = build_sketches(values)
+
+        codes = {}
+        for col in SEGMENT_COLUMNS:
+            col_codes, labels = segment_codes(df[col])
+            codes[col] = (col_codes, labels)
+            found = col_codes >= 0
+            group, size = col_codes[found], len(labels)
+            if sketches:
+                # Rows grouped by segment value, for the per-segment sketches
+                order = np.argsort(col_codes, kind='stable')
+                bounds = np.searchsorted(col_codes[order], np.arange(size + 1))
+            aggregates.segments[col] = {
+                'labels': labels,
+                'rows': np.bincount(group, minlength=size).astype(float),
+                'count': np.column_stack([
+                    np.bincount(group, weights=present[found, i], minlength=size)
+                    for i in range(len(AGGREGATE_COLUMNS))
+                ]),
+                'sum': np.column_stack([
+                    np.bincount(group, weights=filled[found, i], minlength=size)
+                    for i in range(len(AGGREGATE_COLUMNS))
+                ]),
+                'sketches': [
+                    build_sketches(values[order[bounds[j]:bounds[j + 1]]]) if sketches else None for j in range(size)
+                ],
+            }
+
+        for left, right in SEGMENT_CROSSES:
+            (left_codes, left_labels), (right_codes, right_labels) = codes[left], codes[right]
+            found = (left_codes >= 0) & (right_codes >= 0)
+            joint = np.bincount(
+                left_codes[found] * len(right_labels) + right_codes[found],
+                minlength=len(left_labels) * len(right_labels),
+            )
+            aggregates.crosses[(left, right)] = {
+                'labels': (left_labels, right_labels),
+                'rows': joint.reshape(len(left_labels), len(right_labels)).astype(float),
+            }
+
+        group = age_group_codes(values[:, AGGREGATE_COLUMNS.index('Age')])
+        for label, count in zip(AGE_GROUPS, np.bincount(group[group >= 0], minlength=len(AGE_GROUPS))):
+            aggregates.age_groups[label] = int(count)
+        return aggregates
+
+    def merge(self, other):
+        """Aggregates of the union of two disjoint row sets"""
+        merged = SegmentAggregates()
+        merged.rows = self.rows + other.rows
+
+        merged.count = self.count + other.count
+        delta = other.mean - self.mean
+        with np.errstate(invalid='ignore', divide='ignore'):
+            weight = np.where(merged.count > 0, other.count / merged.count, 0.0)
+        merged.mean = self.mean + delta * weight
+        merged.m2 = self.m2 + other.m2 + delta ** 2 * self.count * weight
+        merged.min = np.minimum(self.min, other.min)
+        merged.max = np.maximum(self.max, other.max)
+
+        merged.complete = self.complete + other.complete
+        if merged.complete:
+            delta = other.complete_mean - self.complete_mean
+            weight = other.complete / merged.complete
+            merged.complete_mean = self.complete_mean + delta * weight
+            merged.comoment = self.comoment + other.comoment + np.outer(delta, delta) * self.complete * weight
+
+        for col in SEGMENT_COLUMNS:
+            mine, theirs = self.segments[col], other.segments[col]
+            labels, mine_at, theirs_at = align_labels(mine['labels'], theirs['labels'])
+            combined = {'labels': labels}
+            for key in ('rows', 'count', 'sum'):
+                total = np.zeros((len(labels),) + mine[key].shape[1:])
+                np.add.at(total, mine_at, mine[key])
+                np.add.at(total, theirs_at, theirs[key])
+                combined[key] = total
+            sketches = [None] * len(labels)
+            for positions, side in ((mine_at, mine), (theirs_at, theirs)):
+                for j, sketch in zip(positions, side['sketches']):
+                    sketches[j] = merge_sketches(sketches[j], sketch)
+            combined['sketches'] = sketches
+            merged.segments[col] = combined
+
+        for pair in SEGMENT_CROSSES:
+            mine, theirs = self.crosses[pair], other.crosses[pair]
+            left, mine_left, theirs_left = align_labels(mine['labels'][0], theirs['labels'][0])
+            right, mine_right, theirs_right = align_labels(mine['labels'][1], theirs['labels'][1])
+            total = np.zeros((len(left), len(right)))
+            total[np.ix_(mine_left, mine_right)] += mine['rows']
+            total[np.ix_(theirs_left, theirs_right)] += theirs['rows']
+            merged.crosses[pair] = {'labels': (left, right), 'rows': total}
+
+        merged.age_groups = {label: self.age_groups[label] + other.age_groups[label] for label in AGE_GROUPS}
+        merged.sketches = merge_sketches(self.sketches, other.sketches)
+        return merged
+
+    def segment_sketches(self, segment, col):
+        """Quantile sketch of a column for each value of a segment column"""
+        entry = self.segments[segment]
+        return {
+            label: sketches[col]
+            for label, rows, sketches in zip(entry['labels'], entry['rows'], entry['sketches']) if rows > 0
+        }
+
+    def column_mean(self, col):
+        """Dataset-wide mean of a column, ignoring missing values"""
+        i = AGGREGATE_COLUMNS.index(col)
+        return float(self.mean[i]) if self.count[i] else float('nan')
+
+    def value_counts(self, col):
+        """Rows per value of a segment column, like Series.value_counts"""
+        segment = self.segments[col]
+        return {label: int(rows) for label, rows in zip(segment['labels'], segment['rows']) if rows > 0}
+
+    def segment_table(self, col):
+        """Per-value rows, column sums and column means of a segment column as a frame"""
+        segment = self.segments[col]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = segment['sum'] / segment['count']
+        table = pd.DataFrame(
+            np.column_stack([segment['rows'], segment['sum'], means]),
+            index=pd.Index(segment['labels'], tupleize_cols=False),
+            columns=['rows'] + [f'sum_{col}' for col in AGGREGATE_COLUMNS] + [f'mean_{col}' for col in AGGREGATE_COLUMNS],
+        )
+        return table[table['rows'] > 0]
+
+    def cross_counts(self, left, right):
+        """Joint row counts of two segment columns as a frame"""
+        cross = self.crosses[(left, right)]
+        return pd.DataFrame(cross['rows'], index=cross['labels'][0], columns=cross['labels'][1])
+
+    def std(self, col):
+        """Sample standard deviation of a column, ignoring missing values"""
+        i = AGGREGATE_COLUMNS.index(col)
+        return float(np.sqrt(self.m2[i] / (self.count[i] - 1))) if self.count[i] > 1 else float('nan')
+
+    def correlation(self):
+        """Pearson correlation matrix over rows with every column present, as a frame"""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            scale = np.sqrt(np.diag(self.comoment))
+            corr = self.comoment / np.outer(scale, scale)
+        return pd.DataFrame(corr, index=AGGREGATE_COLUMNS, columns=AGGREGATE_COLUMNS)
+
+def aggregate_row_range(directory, meta, start, stop):
+    """Aggregates of rows [start, stop) of a columnar dataset; runs in an aggregate pool process"""
+    return SegmentAggregates.from_frame(load_columnar(Path(directory), meta).iloc[start:stop])
+
+aggregate_pool = None  # (pid, ProcessPoolExecutor) of this process, created on first use
+aggregate_pool_lock = threading.Lock()
+
+def get_aggregate_pool():
+    """This process's aggregate pool; a forked child never reuses its parent's"""
+    global aggregate_pool
+    with aggregate_pool_lock:
+        if aggregate_pool is None or aggregate_pool[0] != os.getpid():
+            aggregate_pool = (os.getpid(), ProcessPoolExecutor(max_workers=AGGREGATE_WORKERS))
+        return aggregate_pool[1]
+
+def aggregate_columnar(version):
+    """
+    Build a dataset's aggregates as a map-reduce over row ranges
+
+    Each range of AGGREGATE_CHUNK_ROWS rows is aggregated on its own from the
+    memory-mapped columnar copy, on AGGREGATE_WORKERS processes, and the
+    partials are merged in row order. Only one chunk per process is held in
+    memory at a time, however large the file. Inside a pool process (a
+    background job) the chunks are aggregated in-process: a nested pool would
+    multiply the process count and is never shut down when the job exits.
+    """
+    with timed_phase('load'):
+        meta = ensure_columnar(version)
+    directory = str(columnar_dir(version))
+    starts = list(range(0, meta['rows'], AGGREGATE_CHUNK_ROWS)) or [0]
+    stops = [min(start + AGGREGATE_CHUNK_ROWS, meta['rows']) for start in starts]
+    if len(starts) == 1 or AGGREGATE_WORKERS < 2 or multiprocessing.parent_process() is not None:
+        partials = map(aggregate_row_range, itertools.repeat(directory), itertools.repeat(meta), starts, stops)
+    else:
+        partials = get_aggregate_pool().map(
+            aggregate_row_range, itertools.repeat(directory), itertools.repeat(meta), starts, stops
+        )
+    return reduce(SegmentAggregates.merge, partials)
+
+def get_segment_aggregates(version):
+    """Return the segment aggregates for a dataset version, building them on first use"""
+    return analytics_cache.get_or_compute(version, 'aggregates', lambda: aggregate_columnar(version))
+
+# ============ Analytics Snapshot ============
+
+class ResultCache:
+    """Thread-safe store of computed results keyed by dataset version.
+
+    Only the newest version of each dataset path is kept, and at most
+    `max_versions` datasets are held before the least recently used is dropped.
+    Each (version, key) result is computed once even under concurrent requests.
+    """
+
+    def __init__(self, max_versions=ANALYTICS_CACHE_VERSIONS):
+        self.max_versions = max_versions
+        self._results = OrderedDict()  # version -> {key: result}
+        self._building = {}  # (version, key) -> lock held while computing
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, version, key, compute):
+        """Return the cached result for (version, key), computing it on a miss"""
+        with self._lock:
+            entry = self._results.get(version)
+            if entry is not None and key in entry:
+                self._results.move_to_end(version)
+                return entry[key]
+            build_lock = self._building.setdefault((version, key), threading.Lock())
+
+        with build_lock:
+            # Another request may have finished the computation while we waited
+            with self._lock:
+                entry = self._results.get(version)
+                if entry is not None and key in entry:
+                    return entry[key]
+
+            try:
+                result = compute()
+            finally:
+                with self._lock:
+                    self._building.pop((version, key), None)
+
+            self.put(version, key, result)
+        return result
+
+    def put(self, version, key, result):
+        """Store a result computed elsewhere, such as aggregates carried forward by an append"""
+        with self._lock:
+            # Drop stale versions of the same file before storing the new one
+            for stale in [v for v in self._results if v[0] == version[0] and v != version]:
+                del self._results[stale]
+            self._results.setdefault(version, {})[key] = result
+            self._results.move_to_end(version)
+            while len(self._results) > self.max_versions:
+                self._results.popitem(last=False)
+
+    def invalidate(self, path=None):
+        """Forget cached results for one dataset path, or for all datasets"""
+        with self._lock:
+            for version in [v for v in self._results if path is None or v[0] == str(path)]:
+                del self._results[version]
+
+analytics_cache = ResultCache()
+
+def build_analytics_snapshot(aggregates):
+    """Compute the dataset-wide stats and insights payloads that need only the aggregates"""
+    stats = get_aggregated_stats(aggregates)
+    return {
+        'stats': stats,
+        'devices': stats['deviceCounts'],
+        'os': stats['osCounts'],
+        'behavior': {str(k): v for k, v in stats['behaviorCounts'].items()},
+        'demographics': {
+            'ageGroups': stats['ageGroups'],
+            'genderCounts': stats['genderCounts'],
+        },
+        'developer': compute_developer_insights(aggregates),
+        'telecom': compute_telecom_insights(aggregates),
+    }
+
+def get_analytics_snapshot(version):
+    """Return the precomputed analytics snapshot for a dataset version.
+
+    Built from the aggregates alone, so after an append it costs nothing
+    beyond merging the batch's aggregates.
+    """
+    return analytics_cache.get_or_compute(
+        version, 'snapshot', lambda: build_analytics_snapshot(get_segment_aggregates(version))
+    )
+
+def get_researcher_snapshot(version, approx=False):
+    """Return the researcher insights for a dataset version.
+
+    Exact medians read every row of the dataset; with `approx` they come from
+    the quantile sketches, so only the aggregates are needed.
+    """
+    def build():
+        aggregates = get_segment_aggregates(version)
+        if approx:
+            medians = {col: aggregates.sketches[col].quantile(0.5) for col in AGGREGATE_COLUMNS}
+        else:
+            df = dataset_cache.get(version)
+            medians = {col: float(pd.Series(column_values(df[col])).median()) for col in AGGREGATE_COLUMNS}
+        return compute_researcher_insights(aggregates, medians)
+    return analytics_cache.get_or_compute(version, 'researcher_approx' if approx else 'researcher', build)
+
+def wants_approx():
+    """Whether the request asked for sketch-based approximate quantiles (`?approx=true`)"""
+    return request.args.get('approx', '').lower() in ('1', 'true', 'yes')
+
+# ============ User Index ============
+
+def build_user_index(df):
+    """Build a User_ID -> row position hash index, keeping the first row of duplicate IDs"""
+    ids = df['User_ID']
+    duplicated = ids.duplicated().to_numpy()
+    if duplicated.any():
+        app.logger.warning(
+            'Dataset has %d duplicate User_ID values; lookups resolve to the first row',
+            int(duplicated.sum()),
+        )
+    first = np.flatnonzero(~duplicated)
+    values = ids.to_numpy()[first]
+    if np.issubdtype(values.dtype, np.integer):
+        # Narrow stored IDs would make every get_indexer() call upcast and rehash the index
+        values = values.astype(np.int64)
+    return {
+        'index': pd.Index(values),
+        'positions': first,
+        'duplicates': int(duplicated.sum()),
+    }
+
+def get_user_index(version, df):
+    """Return the User_ID index for a dataset version, building it on first use"""
+    return analytics_cache.get_or_compute(version, 'user_index', lambda: build_user_index(df))
+
+def lookup_user_positions(version, df, user_ids):
+    """Row positions for many User_IDs at once, -1 where an ID is not present"""
+    user_index = get_user_index(version, df)
+    found = user_index['index'].get_indexer(user_ids)
+    return np.where(found >= 0, user_index['positions'][found], -1)
+
+def find_user_row(version, df, user_id):
+    """Return the row of a single user as a Series, or None if the ID is unknown"""
+    position = lookup_user_positions(version, df, [user_id])[0]
+    if position < 0:
+        return None
+    # Plain Python values, so arithmetic on narrow int columns cannot overflow
+    return pd.Series({col: column_values(df[col], [position]).tolist()[0] for col in df.columns}, dtype=object)
+
+# ============ Rank Index ============
+
+# Percentile keys reported by the individual insights, by source column
+PERCENTILE_COLUMNS = {
+    'screen_time': 'Screen_On_Time',
+    'app_usage': 'App_Usage_Time',
+    'data_usage': 'Data_Usage',
+    'battery_drain': 'Battery_Drain',
+}
+
+def build_rank_index(df):
+    """Presort the percentile columns and precompute the recommendation thresholds"""
+    sorted_columns = {col: np.sort(column_values(df[col]).astype(float)) for col in PERCENTILE_COLUMNS.values()}
+    return {
+        'rows': len(df),
+        'sorted': sorted_columns,
+        'screen_time_median': float(pd.Series(sorted_columns['Screen_On_Time']).median()),
+        'apps_installed_p75': float(df['Number_of_Apps_Installed'].quantile(0.75)),
+        'battery_drain_median': float(df['Battery_Drain'].median()),
+    }
+
+def build_sketch_rank_index(aggregates):
+    """Rank index answered from the quantile sketches instead of sorted columns"""
+    sketches = aggregates.sketches
+    return {
+        'rows': aggregates.rows,
+        'sketches': {col: sketches[col] for col in PERCENTILE_COLUMNS.values()},
+        'screen_time_median': sketches['Screen_On_Time'].quantile(0.5),
+        'apps_installed_p75': sketches['Number_of_Apps_Installed'].quantile(0.75),
+        'battery_drain_median': sketches['Battery_Drain'].quantile(0.5),
+    }
+
+def get_rank_index(version, df, approx=False):
+    """Return the exact or sketch-based rank index for a dataset version, building it on first use"""
+    if approx:
+        return analytics_cache.get_or_compute(
+            version, 'rank_index_approx', lambda: build_sketch_rank_index(get_segment_aggregates(version))
+        )
+    return analytics_cache.get_or_compute(version, 'rank_index', lambda: build_rank_index(df))
+
+def compute_percentiles(rank_index, column, values):
+    """Percentage of rows whose `column` is <= each value, by binary search or from the column's sketch"""
+    values = np.asarray(values, dtype=float)
+    if 'sketches' in rank_index:
+        counts = rank_index['sketches'][column].rank(values)
+    else:
+        counts = np.searchsorted(rank_index['sorted'][column], values, side='right')
+    counts = np.where(np.isnan(values), 0, counts)  # NaN compares false against every row
+    return counts / rank_index['rows'] * 100
+
+def compute_wellness_scores(screen_times):
+    """Wellness score from screen time (lower usage = higher score)"""
+    return np.clip(100 - (np.asarray(screen_times, dtype=float) / 12 * 100), 0, 100)
+
+# ============ Bitmap Index ============
+
+# Categorical columns with one bitmap per value; Age is indexed by AGE_GROUPS under 'age_group'
+BITMAP_COLUMNS = ['Device_Model', 'Operating_System', 'Gender', 'User_Behavior_Class']
+
+def pack_mask(mask):
+    """Pack a boolean row mask into a bitmap of uint64 words"""
+    packed = np.packbits(mask, bitorder='little')
+    return np.pad(packed, (0, -len(packed) % 8)).view(np.uint64)
+
+def bitmap_positions(bitmap, rows):
+    """Row positions of the set bits of a bitmap"""
+    return np.flatnonzero(np.unpackbits(bitmap.view(np.uint8), count=rows, bitorder='little'))
+
+def build_bitmap_index(df):
+    """One bitmap per value of each indexed column, keyed by the value as a string"""
+    bitmaps = {}
+    for col in BITMAP_COLUMNS:
+        codes, labels = segment_codes(df[col])
+        bitmaps[col] = {str(label): pack_mask(codes == j) for j, label in enumerate(labels)}
+    ages = age_group_codes(df['Age'].to_numpy(dtype=float))
+    bitmaps['age_group'] = {label: pack_mask(ages == j) for j, label in enumerate(AGE_GROUPS)}
+    return {'rows': len(df), 'bitmaps': bitmaps}
+
+def get_bitmap_index(version, df):
+    """Return the bitmap index for a dataset version, building it on first use"""
+    return analytics_cache.get_or_compute(version, 'bitmap_index', lambda: build_bitmap_index(df))
+
+def select_bitmap_rows(bitmap_index, df, args):
+    """
+    Resolve query predicates to row positions
+
+    Predicates on indexed columns (`<Column>=a,b`, `age_group=25-34`) OR the
+    bitmaps of the listed values and AND across columns; `min_<Column>` and
+    `max_<Column>` ranges are then checked on the matching rows only.
+    Raises ValueError on unknown parameters.
+    """
+    bitmaps = bitmap_index['bitmaps']
+    selected = None
+    ranges = []
+    for key in args:
+        raw = args.get(key)
+        if key in bitmaps:
+            empty = np.zeros(-(-bitmap_index['rows'] // 64), dtype=np.uint64)
+            matches = empty
+            for value in raw.split(','):
+                matches = matches | bitmaps[key].get(value, empty)
+            selected = matches if selected is None else selected & matches
+        elif key[:4] in ('min_', 'max_') and key[4:] in df.columns:
+            column = df[key[4:]]
+            if not pd.api.types.is_numeric_dtype(column):
+                raise ValueError(f'Range filter on non-numeric column: {key[4:]}')
+            ranges.append((key, column, parse_filter_value(column, raw)))
+        elif key != 'approx':
+            raise ValueError(f'Unknown query parameter: {key}')
+    
+    positions = np.arange(bitmap_index['rows']) if selected is None \
+        else bitmap_positions(selected, bitmap_index['rows'])
+    for key, column, bound in ranges:
+        values = column_values(column, positions)
+        positions = positions[values >= bound if key.startswith('min_') else values <= bound]
+    return positions
+
+# ============ Data Cube ============
+
+# Cube dimensions; 'age_group' buckets Age by AGE_GROUPS
+CUBE_DIMENSIONS = ['Device_Model', 'Operating_System', 'User_Behavior_Class', 'age_group', 'Gender']
+CUBE_METRICS = ['App_Usage_Time', 'Screen_On_Time', 'Battery_Drain', 'Number_of_Apps_Installed', 'Data_Usage', 'Age']
+
+def dimension_codes(df, dim):
+    """Integer codes and sorted labels of a cube dimension"""
+    if dim == 'age_group':
+        return age_group_codes(df['Age'].to_numpy(dtype=float)), list(AGE_GROUPS)
+    if isinstance(df[dim].dtype, pd.CategoricalDtype):
+        return segment_codes(df[dim])
+    codes, labels = pd.factorize(df[dim], sort=True)
+    return codes, labels.tolist()
+
+def build_cube(df):
+    """
+    Dense cube of row counts and per-metric counts, sums and sums of squares
+
+    Every array has one axis per CUBE_DIMENSIONS entry (metric arrays add a
+    trailing CUBE_METRICS axis), filled by a single bincount per statistic
+    over the flattened cell index. Rows missing a dimension value are left
+    out and counted in 'excluded'. Raises ValueError if the cube would
+    exceed CUBE_MAX_CELLS cells.
+    """
+    codes, labels = zip(*(dimension_codes(df, dim) for dim in CUBE_DIMENSIONS))
+    shape = tuple(len(dim_labels) for dim_labels in labels)
+    size = int(np.prod(shape))
+    if size > CUBE_MAX_CELLS:
+        raise ValueError(f'Data cube would have {size} cells, more than {CUBE_MAX_CELLS}')
+
+    found = np.logical_and.reduce([dim_codes >= 0 for dim_codes in codes])
+    cell = np.ravel_multi_index([dim_codes[found] for dim_codes in codes], shape)
+    values = np.column_stack([column_values(df[col], found).astype(float) for col in CUBE_METRICS])
+    present = ~np.isnan(values)
+    filled = np.where(present, values, 0.0)
+
+    def per_metric(weights):
+        return np.stack(
+            [np.bincount(cell, weights=weights[:, i], minlength=size) for i in range(len(CUBE_METRICS))],
+            axis=-1,
+        ).reshape(shape + (len(CUBE_METRICS),))
+
+    return {
+        'labels': dict(zip(CUBE_DIMENSIONS, labels)),
+        'rows': np.bincount(cell, minlength=size).reshape(shape),
+        'count': per_metric(present),
+        'sum': per_metric(filled),
+        'sumsq': per_metric(filled ** 2),
+        'excluded': int((~found).sum()),
+    }
+
+def get_cube(version, df):
+    """Return the data cube for a dataset version, building it on first use"""
+    return analytics_cache.get_or_compute(version, 'cube', lambda: build_cube(df))
+
+def query_cube(cube, dims, slices):
+    """
+    Slice the cube to the listed labels per dimension, then roll up every
+    dimension not in `dims`. Returns the labels kept for `dims` and the
+    rolled-up arrays with their axes in `dims` order.
+    """
+    arrays = {key: cube[key] for key in ('rows', 'count', 'sum', 'sumsq')}
+    labels = dict(cube['labels'])
+    for axis, dim in enumerate(CUBE_DIMENSIONS):
+        if dim in slices:
+            keep = [i for i, label in enumerate(labels[dim]) if str(label) in slices[dim]]
+            arrays = {key: np.take(array, keep, axis=axis) for key, array in arrays.items()}
+            labels[dim] = [labels[dim][i] for i in keep]
+
+    rolled = tuple(axis for axis, dim in enumerate(CUBE_DIMENSIONS) if dim not in dims)
+    kept = [dim for dim in CUBE_DIMENSIONS if dim in dims]
+    order = [kept.index(dim) for dim in dims]
+    result = {}
+    for key, array in arrays.items():
+        array = array.sum(axis=rolled)
+        result[key] = np.transpose(array, order + list(range(len(order), array.ndim))).copy()
+    return {dim: labels[dim] for dim in dims}, result
+
 # ============ Authentication Endpoints ============
 
 @app.route('/api/auth/register', methods=['POST'])
@@ -150,25 +2063,16 @@ def register():
     if not password or len(password) < 6:
         return error_response('Password must be at least 6 characters', 400, 'INVALID_PASSWORD')
     
-    # Check if email already exists
-    for user in users_db.values():
-        if user['email'] == email:
-            return error_response('Email already registered', 400, 'EMAIL_EXISTS')
-    
-    # Create user
-    user_id = str(len(users_db) + 1)
-    users_db[user_id] = {
-        'id': int(user_id),
-        'name': name,
-        'email': email,
-        'password_hash': hash_password(password),
-    }
+    # Create user; the unique email index rejects duplicates atomically
+    user = registry.create_user(name, email, hash_password(password))
+    if user is None:
+        return error_response('Email already registered', 400, 'EMAIL_EXISTS')
     
-    token = generate_token(user_id)
+    token = generate_token(str(user['id']))
     
     return success_response({
         'user': {
-            'id': int(user_id),
+            'id': user['id'],
             'name': name,
             'email': email,
         },
@@ -189,13 +2093,7 @@ def login():
         return error_response('Email and password are required', 400, 'MISSING_FIELDS')
     
     # Find user by email
-    user = None
-    user_id = None
-    for uid, u in users_db.items():
-        if u['email'] == email:
-            user = u
-            user_id = uid
-            break
+    user = registry.find_user_by_email(email)
     
     if not user:
         return error_response('Invalid email or password', 401, 'INVALID_CREDENTIALS')
@@ -203,7 +2101,7 @@ def login():
     if user['password_hash'] != hash_password(password):
         return error_response('Invalid email or password', 401, 'INVALID_CREDENTIALS')
     
-    token = generate_token(user_id)
+    token = generate_token(str(user['id']))
     
     return success_response({
         'user': {
@@ -214,117 +2112,789 @@ def login():
         'token': token,
     }, 'Login successful')
 
+@app.route('/api/auth/logout', methods=['POST'])
+def logout():
+    """Revoke the bearer token on every worker"""
+    token = bearer_token()
+    payload = decode_token(token) if token else None
+    if not payload:
+        return error_response('Authentication required', 401, 'UNAUTHORIZED')
+    
+    registry.revoke_token(token, payload['exp'])
+    token_cache.invalidate(token=token)
+    return success_response(None, 'Logout successful')
+
 # ============ File Upload Endpoints ============
 
 @app.route('/api/upload/dataset', methods=['POST'])
 def upload_dataset():
-    """Upload a CSV dataset"""
+    """
+    Upload a CSV dataset
+
+    Send the file as the multipart form field `file`, or stream it as the raw
+    request body with `Content-Type: text/csv` and a `filename` query parameter.
+    The file is validated and converted chunk by chunk while it is read, so
+    bad files are rejected early and large files never have to fit in memory.
+    """
     user = get_user_from_token()
     if not user:
         return error_response('Authentication required', 401, 'UNAUTHORIZED')
     
-    if 'file' not in request.files:
-        return error_response('No file provided', 400, 'NO_FILE')
-    
-    file = request.files['file']
-    if file.filename == '':
-        return error_response('No file selected', 400, 'NO_FILE')
+    if request.mimetype == 'text/csv':
+        original_name = request.args.get('filename', 'dataset.csv')
+        stream = request.stream
+    else:
+        if 'file' not in request.files:
+            return error_response('No file provided', 400, 'NO_FILE')
+        
+        file = request.files['file']
+        if file.filename == '':
+            return error_response('No file selected', 400, 'NO_FILE')
+        original_name = file.filename
+        stream = file.stream
     
-    if not allowed_file(file.filename):
+    if not allowed_file(original_name):
         return error_response('Only CSV files are allowed', 400, 'INVALID_FILE_TYPE')
     
     # Create upload folder if it doesn't exist
     UPLOAD_FOLDER.mkdir(exist_ok=True)
     
-    # Save file with user-specific name
-    filename = f"user_{user['id']}_{secure_filename(file.filename)}"
+    # The CSV is copied to a partial file while it is validated, so a rejected
+    # upload never replaces the user's previous dataset
+    filename = f"user_{user['id']}_{secure_filename(original_name)}"
     filepath = UPLOAD_FOLDER / filename
-    file.save(str(filepath))
+    partial = UPLOAD_FOLDER / f'{filename}.part-{os.getpid()}-{threading.get_ident()}'
+    staging = staging_dir(filepath)
+    shutil.rmtree(staging, ignore_errors=True)
     
-    # Validate CSV structure
     try:
-        df = pd.read_csv(filepath)
-        required_columns = ['User_ID', 'Device_Model', 'Operating_System', 'App_Usage_Time']
-        missing = [col for col in required_columns if col not in df.columns]
-        if missing:
-            os.remove(filepath)
-            return error_response(f'Missing required columns: {", ".join(missing)}', 400, 'INVALID_CSV')
-        
-        # Store reference to user's dataset
-        user_datasets[str(user['id'])] = str(filepath)
-        
-        return success_response({
-            'filename': filename,
-            'rows': len(df),
-            'columns': list(df.columns),
-        }, 'Dataset uploaded successfully')
+        with open(partial, 'wb') as copy:
+            meta = ingest_csv(stream, staging, copy, MAX_UPLOAD_BYTES, MAX_UPLOAD_ROWS)
+        with dataset_lock(filepath):
+            os.replace(partial, filepath)
+            publish_columnar(staging, dataset_version(filepath))
+    except IngestError as e:
+        return error_response(e.message, e.status_code, e.code, e.details)
     except Exception as e:
-        if filepath.exists():
-            os.remove(filepath)
         return error_response(f'Error processing CSV: {str(e)}', 400, 'CSV_PARSE_ERROR')
+    finally:
+        if partial.exists():
+            os.remove(partial)
+        shutil.rmtree(staging, ignore_errors=True)
+    
+    # Record the user's dataset and drop analytics built from a previous upload
+    registry.set_dataset(
+        user['id'], filepath, filename, meta['rows'], [col['name'] for col in meta['columns']], meta['digest']
+    )
+    analytics_cache.invalidate(filepath)
+    
+    return success_response({
+        'filename': filename,
+        'rows': meta['rows'],
+        'columns': [col['name'] for col in meta['columns']],
+    }, 'Dataset uploaded successfully')
+
+dataset_thread_lock = threading.Lock()  # Serializes dataset writes where fcntl is not available
+
+@contextmanager
+def dataset_lock(path):
+    """Hold an exclusive lock on a dataset file across threads and worker processes.
+
+    Appends and uploads replacing the file take it, so each append extends the
+    version the previous one published. The lock is an flock() on a `.lock`
+    file next to the dataset; without fcntl only this process's threads are
+    serialized.
+    """
+    if fcntl is None:
+        with dataset_thread_lock:
+            yield
+        return
+    with open(f'{path}.lock', 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def read_append_rows(columns):
+    """Read rows to append as a string frame in the dataset's column order; raises ValueError"""
+    if request.mimetype == 'text/csv':
+        try:
+            frame = pd.read_csv(request.stream, dtype=str, keep_default_na=False, nrows=APPEND_MAX_ROWS + 1)
+        except (pd.errors.ParserError, pd.errors.EmptyDataError, UnicodeDecodeError) as e:
+            raise ValueError(f'Error processing CSV: {str(e)}')
+    else:
+        data = request.get_json(silent=True)
+        records = data.get('records') if isinstance(data, dict) else data
+        if not isinstance(records, list) or not all(isinstance(r, dict) for r in records):
+            raise ValueError('Expected a JSON array of records or a text/csv body')
+        frame = pd.DataFrame(records, dtype=object)
+    if len(frame) > APPEND_MAX_ROWS:
+        raise ValueError(f'At most {APPEND_MAX_ROWS} rows can be appended at once')
+    unknown = [str(col) for col in frame.columns if col not in columns]
+    if unknown:
+        raise ValueError(f'Unknown columns: {", ".join(unknown)}')
+    return frame.reindex(columns=columns)
+
+@app.route('/api/upload/dataset/append', methods=['POST'])
+def append_dataset():
+    """
+    Append rows to the caller's uploaded dataset
+
+    Send a JSON array of records (or {"records": [...]}) keyed by dataset
+    column, or a CSV body with a header row and `Content-Type: text/csv`.
+    Rows are validated against the dataset's column types before anything is
+    written. The dataset's running aggregates are updated from the new rows
+    alone, so the stats and role insights do not rescan the existing data.
+    """
+    user = get_user_from_token()
+    if not user:
+        return error_response('Authentication required', 401, 'UNAUTHORIZED')
+    filepath = registry.dataset_path(user['id'])
+    if filepath is None:
+        return error_response('Upload a dataset before appending rows', 404, 'NO_DATASET')
+    
+    staging = staging_dir(filepath)
+    extended = staging.with_name(f'{staging.name}-extended')
+    with dataset_lock(filepath):
+        version = dataset_version(filepath)
+        meta = ensure_columnar(version)
+        columns = [col['name'] for col in meta['columns']]
+        try:
+            rows = read_append_rows(columns)
+        except ValueError as e:
+            return error_response(str(e), 400, 'INVALID_ROWS')
+        if not len(rows):
+            return error_response('No rows provided', 400, 'NO_DATA')
+        if meta['rows'] + len(rows) > MAX_UPLOAD_ROWS:
+            return error_response(f'Dataset would exceed the {MAX_UPLOAD_ROWS} row limit', 413, 'TOO_MANY_ROWS')
+        
+        # Validate the batch with the dataset's own column types, so the
+        # appended file still converts cleanly
+        column_types = {
+            col['name']: COLUMN_TYPES.get(col['name']) or ('str' if 'categories' in col else 'number')
+            for col in meta['columns']
+        }
+        body = rows.to_csv(index=False, header=False, lineterminator='\n')
+        shutil.rmtree(staging, ignore_errors=True)
+        shutil.rmtree(extended, ignore_errors=True)
+        try:
+            csv_text = rows.iloc[:0].to_csv(index=False, lineterminator='\n') + body
+            batch_meta = ingest_csv(io.BytesIO(csv_text.encode()), staging, column_types=column_types)
+            batch = SegmentAggregates.from_frame(load_columnar(staging, batch_meta))
+            base = get_segment_aggregates(version)
+            try:
+                # Build the new version's columnar copy from the old one, so it is not converted from scratch
+                extend_columnar(version, staging, batch_meta, extended)
+            except Exception:
+                app.logger.exception('Could not extend the columnar copy of %s; it will be rebuilt', filepath)
+                shutil.rmtree(extended, ignore_errors=True)
+        except IngestError as e:
+            return error_response(e.message, e.status_code, e.code, e.details)
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+        
+        try:
+            with open(filepath, 'rb') as f:
+                f.seek(max(version[2] - 1, 0))
+                needs_newline = version[2] > 0 and f.read(1) != b'\n'
+            with open(filepath, 'ab') as f:
+                f.write((('\n' if needs_newline else '') + body).encode())
+        except OSError:
+            shutil.rmtree(extended, ignore_errors=True)
+            raise
+        new_version = dataset_version(filepath)
+        if extended.exists():
+            publish_columnar(extended, new_version)
+        
+        # Carry the running aggregates forward to the new file version
+        aggregates = base.merge(batch)
+        analytics_cache.put(new_version, 'aggregates', aggregates)
+        registry.add_dataset_rows(user['id'], len(rows))
+    
+    return success_response({
+        'rows_appended': len(rows),
+        'rows': aggregates.rows,
+        'stats': get_aggregated_stats(aggregates),
+    }, 'Rows appended successfully')
+
+@app.errorhandler(413)
+def request_too_large(e):
+    """Reject request bodies over MAX_CONTENT_LENGTH before they are read"""
+    return error_response(f'Request exceeds the {MAX_UPLOAD_BYTES} byte upload limit', 413, 'FILE_TOO_LARGE')
+
+# ============ Data Endpoints ============
+
+USERS_RESERVED_PARAMS = {'ids', 'limit', 'offset', 'cursor', 'fields', 'sort', 'format'}
+
+def encode_cursor(offset):
+    """Encode a row offset as an opaque pagination cursor"""
+    return base64.urlsafe_b64encode(json.dumps({'offset': offset}).encode()).decode()
+
+def decode_cursor(cursor):
+    """Decode a pagination cursor back to a row offset"""
+    try:
+        offset = json.loads(base64.urlsafe_b64decode(cursor.encode()))['offset']
+    except (ValueError, KeyError, TypeError):
+        raise ValueError('Invalid cursor')
+    if not isinstance(offset, int) or offset < 0:
+        raise ValueError('Invalid cursor')
+    return offset
+
+def parse_filter_value(series, raw):
+    """Convert a query string value to the type of a column"""
+    if pd.api.types.is_numeric_dtype(series):
+        try:
+            return float(raw)
+        except ValueError:
+            raise ValueError(f'Invalid value for {series.name}: {raw}')
+    return raw
+
+def select_user_rows(df, args, positions=None):
+    """Resolve /api/users filter and sort parameters to an array of row positions.
+
+    `<Column>=a,b` keeps rows equal to any listed value, `min_<Column>` and
+    `max_<Column>` bound numeric columns inclusively and `sort=<Column>` or
+    `sort=-<Column>` orders the result. When `positions` is given only those
+    rows are considered. Raises ValueError on bad parameters.
+    """
+    rows = df if positions is None else df.iloc[positions]
+    mask = np.ones(len(rows), dtype=bool)
+    for key in args:
+        if key in USERS_RESERVED_PARAMS:
+            continue
+        raw = args.get(key)
+        if key in df.columns:
+            values = [parse_filter_value(df[key], v) for v in raw.split(',')]
+            column = rows[key]
+            if column.dtype == np.float32:
+                column = pd.Series(column_values(column))  # Compare at the parsed decimals
+            mask &= column.isin(values).to_numpy()
+        elif key[:4] in ('min_', 'max_') and key[4:] in df.columns:
+            column = rows[key[4:]]
+            if not pd.api.types.is_numeric_dtype(column):
+                raise ValueError(f'Range filter on non-numeric column: {key[4:]}')
+            bound = parse_filter_value(column, raw)
+            values = column_values(column)
+            mask &= values >= bound if key.startswith('min_') else values <= bound
+        else:
+            raise ValueError(f'Unknown query parameter: {key}')
+    positions = np.flatnonzero(mask) if positions is None else positions[mask]
+
+    sort = args.get('sort')
+    if sort:
+        column = sort.lstrip('-')
+        if column not in df.columns:
+            raise ValueError(f'Unknown sort column: {column}')
+        # Rank values so both directions use a stable sort that keeps ties in row order
+        codes = pd.factorize(column_values(df[column], positions), sort=True)[0]
+        if sort.startswith('-') and len(codes):
+            codes = np.where(codes >= 0, codes.max() - codes, codes)
+        codes[codes < 0] = len(codes)  # Missing values sort last
+        positions = positions[np.argsort(codes, kind='stable')]
+    return positions
+
+def iter_record_batches(df, columns, positions, batch_rows=STREAM_BATCH_ROWS):
+    """Yield lists of row dicts built directly from the column arrays.
+
+    Only the rows of the current batch are decoded, so a stream never holds
+    more than `batch_rows` decoded values per column.
+    """
+    for start in range(0, len(positions), batch_rows):
+        rows = positions[start:start + batch_rows]
+        values = [column_values(df[col], rows).tolist() for col in columns]
+        yield [dict(zip(columns, row)) for row in zip(*values)]
+
+@app.route('/api/users', methods=['GET'])
+@dataset_etag
+def get_all_users():
+    """
+    Get users data
+
+    Query parameters (all optional):
+        fields=User_ID,Age          Only return these columns
+        Operating_System=Android    Keep rows matching any of the comma-separated values
+        min_Age=25&max_Age=34       Inclusive numeric range filters
+        sort=-Data_Usage            Sort by a column, descending with a leading '-'
+        limit=100                   Page size; enables the paginated response envelope
+        offset=200 or cursor=...    Page start, as a row offset or a next_cursor value
+        format=ndjson               Stream rows as newline-delimited JSON
+        format=columns              Return {column: [values]} arrays instead of row objects
+        ids=1,5,42                  Fetch these users (in this order) via the User_ID index;
+                                    the response is an envelope listing `missing` IDs
+    """
+    version, df = resolve_dataset()
+    args = request.args
+
+    fields = args.get('fields')
+    columns = fields.split(',') if fields else list(df.columns)
+    unknown = [col for col in columns if col not in df.columns]
+    if unknown:
+        return error_response(f'Unknown fields: {", ".join(unknown)}', 400, 'INVALID_FIELDS')
+
+    missing = None
+    try:
+        positions = None
+        if 'ids' in args:
+            try:
+                ids = [int(v) for v in args['ids'].split(',') if v]
+            except ValueError:
+                raise ValueError('ids must be a comma-separated list of integers')
+            if len(ids) > USERS_PAGE_MAX:
+                raise ValueError(f'At most {USERS_PAGE_MAX} ids can be requested at once')
+            found = lookup_user_positions(version, df, ids)
+            missing = [user_id for user_id, position in zip(ids, found) if position < 0]
+            positions = found[found >= 0]
+        positions = select_user_rows(df, args, positions)
+        paginated = any(key in args for key in ('limit', 'offset', 'cursor'))
+        offset = decode_cursor(args['cursor']) if 'cursor' in args else int(args.get('offset', 0))
+        limit = int(args.get('limit', USERS_PAGE_MAX))
+    except ValueError as e:
+        return error_response(str(e), 400, 'INVALID_QUERY')
+    if offset < 0 or not 1 <= limit <= USERS_PAGE_MAX:
+        return error_response(f'limit must be between 1 and {USERS_PAGE_MAX} and offset non-negative', 400, 'INVALID_QUERY')
+
+    total = len(positions)
+    if paginated:
+        positions = positions[offset:offset + limit]
+    next_offset = offset + len(positions)
+    next_cursor = encode_cursor(next_offset) if paginated and next_offset < total else None
+
+    if args.get('format') == 'ndjson':
+        def generate():
+            for batch in iter_record_batches(df, columns, positions):
+                yield ndjson_lines(batch)
+        response = Response(generate(), mimetype='application/x-ndjson')
+        response.headers['X-Total-Count'] = str(total)
+        if next_cursor:
+            response.headers['X-Next-Cursor'] = next_cursor
+        return response
+
+    if args.get('format') == 'columns':
+        # Column arrays are encoded straight from NumPy, without building a dict per row
+        page = {
+            'columns': {col: column_values(df[col], positions) for col in columns},
+            'total': total,
+        }
+        if paginated:
+            page.update(offset=offset, limit=limit, next_cursor=next_cursor)
+        if missing is not None:
+            page['missing'] = missing
+        return success_response(page)
+
+    users = [row for batch in iter_record_batches(df, columns, positions) for row in batch]
+    if missing is not None and not paginated:
+        return success_response({'items': users, 'missing': missing})
+    if not paginated:
+        return success_response(users)
+    page = {
+        'items': users,
+        'total': total,
+        'offset': offset,
+        'limit': limit,
+        'next_cursor': next_cursor,
+    }
+    if missing is not None:
+        page['missing'] = missing
+    return success_response(page)
+
+@app.route('/api/users/<int:user_id>', methods=['GET'])
+@dataset_etag
+def get_user(user_id):
+    """Get a specific user by ID"""
+    version, df = resolve_dataset()
+    user = find_user_row(version, df, user_id)
+    if user is None:
+        return error_response(f'User {user_id} not found', 404, 'USER_NOT_FOUND')
+    return success_response(user.to_dict())
+
+# ============ Analytics Endpoints ============
+
+@app.route('/api/stats', methods=['GET'])
+@dataset_etag
+def get_stats():
+    """Get aggregated statistics"""
+    return success_response(get_analytics_snapshot(current_dataset_version())['stats'])
+
+@app.route('/api/analytics/devices', methods=['GET'])
+@dataset_etag
+def get_device_distribution():
+    """Get device model distribution"""
+    return success_response(get_analytics_snapshot(current_dataset_version())['devices'])
+
+@app.route('/api/analytics/os', methods=['GET'])
+@dataset_etag
+def get_os_distribution():
+    """Get operating system distribution"""
+    return success_response(get_analytics_snapshot(current_dataset_version())['os'])
+
+@app.route('/api/analytics/behavior', methods=['GET'])
+@dataset_etag
+def get_behavior_distribution():
+    """Get user behavior class distribution"""
+    # Keys are converted to strings for JSON compatibility when the snapshot is built
+    return success_response(get_analytics_snapshot(current_dataset_version())['behavior'])
+
+@app.route('/api/analytics/demographics', methods=['GET'])
+@dataset_etag
+def get_demographics():
+    """Get demographic breakdown"""
+    return success_response(get_analytics_snapshot(current_dataset_version())['demographics'])
+
+@app.route('/api/query', methods=['GET'])
+@dataset_etag
+def query_stats():
+    """
+    Get the /api/stats aggregates for the users matching a set of predicates
+    
+    Query parameters (all optional, combined with AND):
+        Operating_System=Android     Any of the comma-separated values; also
+                                     Device_Model, Gender and User_Behavior_Class
+        age_group=25-34,35-44        Any of the /api/analytics/demographics age groups
+        min_Data_Usage=500           Inclusive numeric range on any numeric column
+    
+    Categorical predicates are answered from precomputed bitmap indexes.
+    """
+    version, df = resolve_dataset()
+    try:
+        positions = select_bitmap_rows(get_bitmap_index(version, df), df, request.args)
+    except ValueError as e:
+        return error_response(str(e), 400, 'INVALID_QUERY')
+    
+    aggregates = SegmentAggregates.from_frame(df.iloc[positions], sketches=False)
+    return success_response({
+        'matched': len(positions),
+        'total': len(df),
+        'stats': get_aggregated_stats(aggregates),
+    })
+
+@app.route('/api/cube', methods=['GET'])
+@dataset_etag
+def get_cube_slice():
+    """
+    Get counts, sums, means and standard deviations from the data cube
+    
+    Query parameters (all optional):
+        dims=Device_Model,User_Behavior_Class   Dimensions to keep; the others are rolled up
+                                                (Device_Model, Operating_System,
+                                                User_Behavior_Class, age_group, Gender)
+        metrics=Data_Usage,Age                  Metrics to return (default: all)
+        Operating_System=Android                Slice a dimension to the listed values
+    
+    Arrays are nested with one level per entry of `dims`, in that order.
+    """
+    args = request.args
+    dims = [d for d in args.get('dims', '').split(',') if d]
+    metrics = [m for m in args.get('metrics', '').split(',') if m] or CUBE_METRICS
+    unknown = [d for d in dims if d not in CUBE_DIMENSIONS] + [m for m in metrics if m not in CUBE_METRICS] \
+        + [key for key in args if key not in ('dims', 'metrics') and key not in CUBE_DIMENSIONS]
+    if unknown or len(set(dims)) != len(dims):
+        return error_response(f'Invalid cube query: {", ".join(unknown) or "repeated dims"}', 400, 'INVALID_QUERY')
+    
+    version, df = resolve_dataset()
+    try:
+        cube = get_cube(version, df)
+    except ValueError as e:
+        return error_response(str(e), 400, 'CUBE_TOO_LARGE')
+    slices = {dim: set(args[dim].split(',')) for dim in CUBE_DIMENSIONS if dim in args}
+    labels, arrays = query_cube(cube, dims, slices)
+    
+    count, sums, sumsq = arrays['count'], arrays['sum'], arrays['sumsq']
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = sums / count
+        variance = np.maximum(sumsq - sums * means, 0) / (count - 1)
+    result = {
+        'dims': dims,
+        'labels': labels,
+        'rows': arrays['rows'],
+        'metrics': {},
+    }
+    for metric in metrics:
+        i = CUBE_METRICS.index(metric)
+        result['metrics'][metric] = {
+            'sum': sums[..., i].copy(),
+            'mean': np.where(count[..., i] > 0, means[..., i], np.nan),
+            'std': np.where(count[..., i] > 1, np.sqrt(variance[..., i]), np.nan),
+        }
+    return success_response(result)
+
+@app.route('/api/analytics/quantiles', methods=['GET'])
+@dataset_etag
+def get_quantiles():
+    """
+    Get quantiles of a numeric column, overall or per segment
+    
+    Query parameters:
+    - column: numeric column, e.g. Data_Usage (required)
+    - q: comma-separated quantiles in [0, 1] (default: 0.5)
+    - by: optional segment column (User_Behavior_Class, Device_Model,
+      Operating_System or Gender)
+    - approx: true to answer from the quantile sketches instead of the rows
+    """
+    column = request.args.get('column')
+    by = request.args.get('by')
+    if column not in AGGREGATE_COLUMNS:
+        return error_response(f'column must be one of {", ".join(AGGREGATE_COLUMNS)}', 400, 'INVALID_QUERY')
+    if by is not None and by not in SEGMENT_COLUMNS:
+        return error_response(f'by must be one of {", ".join(SEGMENT_COLUMNS)}', 400, 'INVALID_QUERY')
+    try:
+        qs = [float(q) for q in request.args.get('q', '0.5').split(',')]
+    except ValueError:
+        return error_response('q must be comma-separated numbers', 400, 'INVALID_QUERY')
+    if not all(0 <= q <= 1 for q in qs):
+        return error_response('q values must be between 0 and 1', 400, 'INVALID_QUERY')
+    
+    version = current_dataset_version()
+    result = {'column': column, 'q': qs, 'approx': wants_approx()}
+    if wants_approx():
+        aggregates = get_segment_aggregates(version)
+        result['rank_error'] = aggregates.sketches[column].rank_error
+        if by is None:
+            result['quantiles'] = aggregates.sketches[column].quantile(qs).tolist()
+        else:
+            result['segments'] = {
+                label: sketch.quantile(qs).tolist()
+                for label, sketch in aggregates.segment_sketches(by, column).items()
+            }
+        return success_response(result)
+    
+    df = dataset_cache.get(version)
+    values = column_values(df[column]).astype(float)
+    if by is None:
+        result['quantiles'] = pd.Series(values).quantile(qs).tolist()
+    else:
+        table = df[[by]].assign(**{column: values}).groupby(by, observed=True)[column].quantile(qs).unstack()
+        result['segments'] = {label: values.tolist() for label, values in table.iterrows()}
+    return success_response(result)
+
+# ============ Model Registry ============
+
+# Request keys accepted by the prediction endpoints, mapped to dataset columns
+MODEL_FEATURES = {
+    'device_model': 'Device_Model',
+    'operating_system': 'Operating_System',
+    'app_usage_time': 'App_Usage_Time',
+    'screen_on_time': 'Screen_On_Time',
+    'battery_drain': 'Battery_Drain',
+    'number_of_apps_installed': 'Number_of_Apps_Installed',
+    'data_usage': 'Data_Usage',
+    'age': 'Age',
+    'gender': 'Gender',
+}
+MODEL_CATEGORICAL = ['Device_Model', 'Operating_System', 'Gender']
+MODEL_NUMERIC = [col for col in MODEL_FEATURES.values() if col not in MODEL_CATEGORICAL]
+
+def model_input_frame(frame):
+    """Select and type the model feature columns, filling absent ones with missing values"""
+    columns = {}
+    for col in MODEL_FEATURES.values():
+        values = frame[col] if col in frame.columns else pd.Series(np.nan, index=frame.index)
+        if col in MODEL_CATEGORICAL:
+            columns[col] = values.astype(object).where(values.notna(), 'Unknown').astype(str)
+        else:
+            columns[col] = pd.Series(column_values(pd.to_numeric(values)), index=frame.index).astype(float)
+    return pd.DataFrame(columns, index=frame.index)
+
+def train_behavior_model(df):
+    """Fit a behavior class classifier on a dataset; returns (model, holdout accuracy)"""
+    from sklearn.compose import ColumnTransformer
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.impute import SimpleImputer
+    from sklearn.model_selection import train_test_split
+    from sklearn.pipeline import Pipeline
+    from sklearn.preprocessing import OneHotEncoder
+
+    def build():
+        return Pipeline([
+            ('features', ColumnTransformer([
+                ('categorical', OneHotEncoder(handle_unknown='ignore'), MODEL_CATEGORICAL),
+                ('numeric', SimpleImputer(strategy='median'), MODEL_NUMERIC),
+            ])),
+            ('classifier', RandomForestClassifier(n_estimators=100, max_depth=12, random_state=42)),
+        ])
 
-# ============ Data Endpoints ============
+    X = model_input_frame(df)
+    y = df['User_Behavior_Class'].to_numpy()
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+    accuracy = float(build().fit(X_train, y_train).score(X_test, y_test))
+    return build().fit(X, y), accuracy
 
-@app.route('/api/users', methods=['GET'])
-def get_all_users():
-    """Get all users data"""
-    df = load_data()
-    users = df.to_dict(orient='records')
-    return success_response(users)
+class ModelRegistry:
+    """Versioned behavior classifiers stored under a models directory.
 
-@app.route('/api/users/<int:user_id>', methods=['GET'])
-def get_user(user_id):
-    """Get a specific user by ID"""
-    df = load_data()
-    user = df[df['User_ID'] == user_id]
-    if user.empty:
-        return error_response(f'User {user_id} not found', 404, 'USER_NOT_FOUND')
-    return success_response(user.to_dict(orient='records')[0])
+    Each version is a `behavior-<version>.joblib` artifact plus a JSON metadata
+    file. The `ACTIVE` file names the version used for predictions and is
+    replaced atomically, so every worker picks up a newly published version on
+    its next prediction without ever seeing a half-written model.
+    """
 
-# ============ Analytics Endpoints ============
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self._active = None  # (version, model) currently loaded in this process
+        self._active_stamp = None  # ACTIVE file identity the loaded model came from
+        self._latencies = {}  # version -> {'count', 'total', 'recent'}
+        self._lock = threading.Lock()
 
-@app.route('/api/stats', methods=['GET'])
-def get_stats():
-    """Get aggregated statistics"""
-    df = load_data()
-    stats = get_aggregated_stats(df)
-    return success_response(stats)
+    def _pointer(self):
+        return self.directory / 'ACTIVE'
 
-@app.route('/api/analytics/devices', methods=['GET'])
-def get_device_distribution():
-    """Get device model distribution"""
-    df = load_data()
-    distribution = df['Device_Model'].value_counts().to_dict()
-    return success_response(distribution)
+    def _artifact(self, version):
+        return self.directory / f'behavior-{version}.joblib'
 
-@app.route('/api/analytics/os', methods=['GET'])
-def get_os_distribution():
-    """Get operating system distribution"""
-    df = load_data()
-    distribution = df['Operating_System'].value_counts().to_dict()
-    return success_response(distribution)
+    def publish(self, model, info, activate=True):
+        """Store a new model version, optionally making it the active one"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        version = datetime.datetime.utcnow().strftime('%Y%m%d%H%M%S') + '-' + uuid.uuid4().hex[:6]
+        partial = self.directory / f'.behavior-{version}.tmp'
+        joblib.dump(model, partial)  # Uncompressed so it can be memory-mapped
+        os.replace(partial, self._artifact(version))
+        with open(self.directory / f'behavior-{version}.json', 'w') as f:
+            json.dump(dict(info, version=version, created_at=datetime.datetime.utcnow().isoformat() + 'Z'), f)
+        if activate:
+            self.activate(version)
+        return version
 
-@app.route('/api/analytics/behavior', methods=['GET'])
-def get_behavior_distribution():
-    """Get user behavior class distribution"""
-    df = load_data()
-    distribution = df['User_Behavior_Class'].value_counts().to_dict()
-    # Convert keys to strings for JSON compatibility
-    distribution = {str(k): v for k, v in distribution.items()}
-    return success_response(distribution)
+    def activate(self, version):
+        """Point the registry at an existing version; raises KeyError if it is unknown"""
+        if not self._artifact(version).exists():
+            raise KeyError(version)
+        partial = self.directory / f'.ACTIVE.{os.getpid()}.tmp'
+        partial.write_text(version)
+        os.replace(partial, self._pointer())
 
-@app.route('/api/analytics/demographics', methods=['GET'])
-def get_demographics():
-    """Get demographic breakdown"""
-    df = load_data()
-    stats = get_aggregated_stats(df)
-    return success_response({
-        'ageGroups': stats['ageGroups'],
-        'genderCounts': stats['genderCounts'],
-    })
+    def active(self):
+        """Return (version, model) for the active version, or (None, None) if there is none"""
+        try:
+            stat = os.stat(self._pointer())
+            stamp = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+        except FileNotFoundError:
+            return None, None
+        if stamp != self._active_stamp:
+            with self._lock:
+                if stamp != self._active_stamp:
+                    version = self._pointer().read_text().strip()
+                    model = joblib.load(self._artifact(version), mmap_mode='r' if MODEL_MMAP else None)
+                    # Swap in one assignment so concurrent requests see either model, never a mix
+                    self._active = (version, model)
+                    self._active_stamp = stamp
+        return self._active
+
+    def predict_proba(self, frame):
+        """Class probabilities from the active model; returns (version, classes, probabilities)"""
+        version, model = self.active()
+        started = time.perf_counter()
+        probabilities = model.predict_proba(model_input_frame(frame))
+        self.record_latency(version, time.perf_counter() - started, len(frame))
+        return version, model.classes_, probabilities
+
+    def record_latency(self, version, seconds, rows):
+        with self._lock:
+            stats = self._latencies.setdefault(
+                version, {'count': 0, 'rows': 0, 'total': 0.0, 'recent': deque(maxlen=MODEL_LATENCY_SAMPLES)}
+            )
+            stats['count'] += 1
+            stats['rows'] += rows
+            stats['total'] += seconds
+            stats['recent'].append(seconds)
+
+    def latency_stats(self, version):
+        """Inference latency for one version in this process, in milliseconds"""
+        with self._lock:
+            stats = self._latencies.get(version)
+            if not stats:
+                return None
+            recent = np.array(stats['recent']) * 1000
+            return {
+                'calls': stats['count'],
+                'rows': stats['rows'],
+                'mean_ms': round(stats['total'] / stats['count'] * 1000, 3),
+                'p50_ms': round(float(np.percentile(recent, 50)), 3),
+                'p95_ms': round(float(np.percentile(recent, 95)), 3),
+                'p99_ms': round(float(np.percentile(recent, 99)), 3),
+            }
+
+    def versions(self):
+        """Metadata of every stored version, newest first"""
+        result = []
+        for meta_path in sorted(self.directory.glob('behavior-*.json'), reverse=True):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            meta['latency'] = self.latency_stats(meta['version'])
+            result.append(meta)
+        return result
+
+model_registry = ModelRegistry(MODEL_PATH)
+
+try:
+    model_registry.active()  # Warm-load the active model when the worker starts
+except Exception as e:
+    app.logger.warning('Could not load the active behavior model: %s', e)
 
 # ============ ML Prediction Endpoints ============
 
+BEHAVIOR_CLASSES = [1, 2, 3, 4, 5]
+
+def score_behavior(app_usage, screen_time):
+    """
+    Heuristic behavior classes and mock class probabilities for arrays of usage values
+
+    Returns (predicted_class, probabilities) where probabilities has one column
+    per entry of BEHAVIOR_CLASSES.
+    """
+    app_usage = np.asarray(app_usage, dtype=float)
+    screen_time = np.asarray(screen_time, dtype=float)
+    
+    # Simple heuristic based on usage patterns
+    score = (app_usage / 600) * 0.4 + (screen_time / 12) * 0.6
+    predicted_class = np.digitize(score, [0.2, 0.4, 0.6, 0.8]) + 1
+    
+    # Generate mock probabilities, weighting the predicted class
+    probabilities = np.round(np.random.random((len(score), len(BEHAVIOR_CLASSES))) * 0.2, 3)
+    rows = np.arange(len(score))
+    probabilities[rows, predicted_class - 1] = np.round(0.5 + np.random.random(len(score)) * 0.3, 3)
+    
+    # Normalize
+    probabilities = np.round(probabilities / probabilities.sum(axis=1, keepdims=True), 3)
+    return predicted_class, probabilities
+
+def read_batch_records():
+    """Read batch prediction input as a DataFrame with lower-cased column names; raises ValueError"""
+    if 'file' in request.files:
+        frame = pd.read_csv(request.files['file'].stream, nrows=PREDICT_BATCH_MAX + 1)
+    else:
+        data = request.get_json(silent=True)
+        records = data.get('records') if isinstance(data, dict) else data
+        if not isinstance(records, list) or not all(isinstance(r, dict) for r in records):
+            raise ValueError('Expected a JSON array of records or an uploaded CSV file')
+        frame = pd.DataFrame(records, dtype=object)
+    if len(frame) > PREDICT_BATCH_MAX:
+        raise ValueError(f'At most {PREDICT_BATCH_MAX} records can be scored at once')
+    frame.columns = [str(col).lower() for col in frame.columns]
+    return frame
+
+def predict_behavior_records(frame):
+    """
+    Class probabilities for request records keyed like MODEL_FEATURES
+    
+    Uses the active registry model when one has been published and falls
+    back to the usage heuristic otherwise. Returns (model_version or None,
+    classes, probabilities) with one probability column per class.
+    """
+    frame = frame.rename(columns=lambda col: str(col).lower())
+    if model_registry.active()[0] is not None:
+        return model_registry.predict_proba(frame.rename(columns=MODEL_FEATURES))
+    
+    _, probabilities = score_behavior(
+        feature_values(frame, 'app_usage_time'), feature_values(frame, 'screen_on_time')
+    )
+    return None, np.array(BEHAVIOR_CLASSES), probabilities
+
+def feature_values(frame, name, default=0):
+    """Numeric feature column as a float array, with missing values replaced by a default"""
+    if name not in frame.columns:
+        return np.full(len(frame), float(default))
+    return pd.to_numeric(frame[name]).fillna(default).to_numpy(dtype=float)
+
 @app.route('/api/predict/behavior', methods=['POST'])
 def predict_behavior():
     """
@@ -347,42 +2917,230 @@ def predict_behavior():
     if not data:
         return error_response('No data provided', 400, 'NO_DATA')
     
-    # For now, use a simple rule-based prediction
-    # Replace this with actual ML model loading and prediction
-    app_usage = data.get('app_usage_time', 0)
-    screen_time = data.get('screen_on_time', 0)
+    try:
+        model_version, classes, probability_rows = predict_behavior_records(pd.DataFrame([data]))
+    except (ValueError, TypeError) as e:
+        return error_response(str(e), 400, 'INVALID_FEATURES')
+    probabilities = dict(zip(classes.tolist(), probability_rows[0].tolist()))
+    predicted_class = max(probabilities, key=probabilities.get)
     
-    # Simple heuristic based on usage patterns
-    score = (app_usage / 600) * 0.4 + (screen_time / 12) * 0.6
+    result = {
+        'predicted_class': predicted_class,
+        'confidence': probabilities[predicted_class],
+        'probabilities': probabilities,
+    }
+    if model_version:
+        result['model_version'] = model_version
+    return success_response(result)
+
+@app.route('/api/predict/behavior/batch', methods=['POST'])
+def predict_behavior_batch():
+    """
+    Predict behavior classes for many records in one vectorized pass
     
-    if score < 0.2:
-        predicted_class = 1
-    elif score < 0.4:
-        predicted_class = 2
-    elif score < 0.6:
-        predicted_class = 3
-    elif score < 0.8:
-        predicted_class = 4
-    else:
-        predicted_class = 5
+    Accepts a JSON array of records shaped like /api/predict/behavior input
+    (optionally wrapped as {"records": [...]}), or a CSV uploaded as the form
+    field `file` whose column names match those keys case-insensitively.
+    Records carrying a `user_id` have it echoed back as `user_ids`.
     
-    # Generate mock probabilities
-    probabilities = {}
-    for i in range(1, 6):
-        if i == predicted_class:
-            probabilities[i] = round(0.5 + np.random.random() * 0.3, 3)
-        else:
-            probabilities[i] = round(np.random.random() * 0.2, 3)
+    The response is columnar: every list is aligned with the input rows. Pass
+    ?format=ndjson to stream one JSON object per record instead.
+    """
+    try:
+        frame = read_batch_records()
+        model_version, classes, probabilities = predict_behavior_records(frame)
+    except (ValueError, TypeError, pd.errors.ParserError, pd.errors.EmptyDataError) as e:
+        return error_response(str(e), 400, 'INVALID_BATCH')
+    
+    best = probabilities.argmax(axis=1)
+    predicted_class = classes[best]
+    confidence = probabilities[np.arange(len(best)), best]
+    class_keys = classes.tolist()
+    user_ids = None
+    if 'user_id' in frame.columns:
+        user_ids = [None if pd.isna(v) else v for v in frame['user_id'].tolist()]
+    
+    if request.args.get('format') == 'ndjson':
+        def generate():
+            for start in range(0, len(predicted_class), STREAM_BATCH_ROWS):
+                end = start + STREAM_BATCH_ROWS
+                rows = []
+                for i, (cls, conf, probs) in enumerate(zip(
+                    predicted_class[start:end].tolist(),
+                    confidence[start:end].tolist(),
+                    probabilities[start:end].tolist(),
+                )):
+                    row = {'predicted_class': cls, 'confidence': conf, 'probabilities': dict(zip(class_keys, probs))}
+                    if user_ids is not None:
+                        row['user_id'] = user_ids[start + i]
+                    rows.append(row)
+                yield ndjson_lines(rows)
+        return Response(generate(), mimetype='application/x-ndjson')
+    
+    result = {
+        'predicted_class': predicted_class,
+        'confidence': confidence,
+        'probabilities': {str(cls): np.ascontiguousarray(probabilities[:, i]) for i, cls in enumerate(class_keys)},
+    }
+    if user_ids is not None:
+        result['user_ids'] = user_ids
+    if model_version:
+        result['model_version'] = model_version
+    return success_response(result)
+
+@app.route('/api/models', methods=['GET'])
+def list_models():
+    """List stored behavior model versions with their inference latency in this worker"""
+    return success_response({
+        'active': model_registry.active()[0],
+        'versions': model_registry.versions(),
+    })
+
+@app.route('/api/models/train', methods=['POST'])
+def train_model():
+    """
+    Train a behavior classifier on the caller's dataset and publish it
     
-    # Normalize
-    total = sum(probabilities.values())
-    probabilities = {k: round(v/total, 3) for k, v in probabilities.items()}
+    Optional JSON body:
+    {
+        "activate": false
+    }
+    """
+    user = get_user_from_token()
+    if not user:
+        return error_response('Authentication required', 401, 'UNAUTHORIZED')
+    if not is_admin(user):
+        return error_response('Only administrators can train models', 403, 'FORBIDDEN')
+    
+    data = request.get_json(silent=True) or {}
+    version, df = resolve_dataset()
+    missing = [col for col in list(MODEL_FEATURES.values()) + ['User_Behavior_Class'] if col not in df.columns]
+    if missing:
+        return error_response(f'Dataset is missing columns: {", ".join(missing)}', 400, 'INVALID_DATASET')
+    
+    model, accuracy = train_behavior_model(df)
+    model_version = model_registry.publish(model, {
+        'rows': len(df),
+        'dataset': Path(version[0]).name,
+        'holdout_accuracy': round(accuracy, 4),
+    }, activate=data.get('activate', False))
     
     return success_response({
-        'predicted_class': predicted_class,
-        'confidence': probabilities[predicted_class],
-        'probabilities': probabilities,
+        'version': model_version,
+        'holdout_accuracy': round(accuracy, 4),
+        'active': model_registry.active()[0] == model_version,
+    }, 'Model trained successfully')
+
+@app.route('/api/models/<version>/activate', methods=['POST'])
+def activate_model(version):
+    """Make a stored model version the active one"""
+    user = get_user_from_token()
+    if not user:
+        return error_response('Authentication required', 401, 'UNAUTHORIZED')
+    if not is_admin(user):
+        return error_response('Only administrators can activate models', 403, 'FORBIDDEN')
+    
+    try:
+        model_registry.activate(secure_filename(version))
+    except KeyError:
+        return error_response(f'Model version {version} not found', 404, 'MODEL_NOT_FOUND')
+    return success_response({'active': model_registry.active()[0]}, 'Model activated')
+
+# Usage predictions by response key: (source column, decimals)
+USAGE_TARGETS = {
+    'predicted_screen_time': ('Screen_On_Time', 2),
+    'predicted_app_usage': ('App_Usage_Time', 0),
+    'predicted_data_usage': ('Data_Usage', 0),
+    'predicted_battery_drain': ('Battery_Drain', 0),
+}
+USAGE_AGE_BANDS = {'<30': 30, '30-44': 45, '45+': np.inf}  # Band label -> exclusive upper age
+USAGE_MIN_SEGMENT_ROWS = 20  # Smaller segments fall back to their age band, then the whole dataset
+USAGE_ANY = '*'  # Wildcard key for the age band and whole-dataset fallback rows
+
+def age_bands(ages):
+    """Usage model age band label for each age"""
+    labels = np.array(list(USAGE_AGE_BANDS))
+    return labels[np.searchsorted(list(USAGE_AGE_BANDS.values()), ages, side='right')]
+
+def build_usage_model(df):
+    """
+    Fit usage ~ apps installed regressions per device, OS and age band
+    
+    All segments are fitted from grouped sums in a single pass. The result
+    is a small table indexed by (device, os, band) holding an intercept and
+    slope per target, plus (*, *, band) and (*, *, *) fallback rows.
+    """
+    targets = [col for col, _ in USAGE_TARGETS.values()]
+    used = df[['Device_Model', 'Operating_System', 'Age', 'Number_of_Apps_Installed'] + targets].dropna()
+    x = used['Number_of_Apps_Installed'].to_numpy(dtype=float)
+    work = pd.DataFrame({
+        'device': used['Device_Model'].to_numpy(dtype=object),
+        'os': used['Operating_System'].to_numpy(dtype=object),
+        'band': age_bands(used['Age'].to_numpy(dtype=float)),
+        'n': 1.0,
+        'x': x,
+        'xx': x * x,
     })
+    for col in targets:
+        y = column_values(used[col]).astype(float)
+        work['y_' + col] = y
+        work['xy_' + col] = x * y
+    
+    segments = work.groupby(['device', 'os', 'band']).sum()
+    bands = work.drop(columns=['device', 'os']).groupby('band').sum()
+    bands.index = pd.MultiIndex.from_product([[USAGE_ANY], [USAGE_ANY], bands.index])
+    overall = work.drop(columns=['device', 'os', 'band']).sum().to_frame().T
+    overall.index = pd.MultiIndex.from_tuples([(USAGE_ANY, USAGE_ANY, USAGE_ANY)])
+    sums = pd.concat([segments[segments['n'] >= USAGE_MIN_SEGMENT_ROWS], bands[bands['n'] >= USAGE_MIN_SEGMENT_ROWS], overall])
+    sums.index.names = ['device', 'os', 'band']
+    
+    # Least squares from sufficient statistics; flat segments get a zero slope
+    table = pd.DataFrame({'rows': sums['n'].astype(int)}, index=sums.index)
+    n, sx, sxx = sums['n'], sums['x'], sums['xx']
+    denominator = n * sxx - sx * sx
+    for col in targets:
+        sy, sxy = sums['y_' + col], sums['xy_' + col]
+        slope = ((n * sxy - sx * sy) / denominator).where(denominator > 0, 0.0)
+        table['slope_' + col] = slope.fillna(0.0)
+        table['intercept_' + col] = ((sy - slope * sx) / n).fillna(0.0)
+    return table
+
+def get_usage_model(version, df):
+    """Return the usage regression table for a dataset version, fitting it on first use"""
+    return analytics_cache.get_or_compute(version, 'usage_model', lambda: build_usage_model(df))
+
+def usage_features(frame):
+    """Device, OS, age and apps arrays from records with lower-cased keys, using the documented defaults"""
+    def text(name):
+        if name not in frame.columns:
+            return np.full(len(frame), USAGE_ANY, dtype=object)
+        return frame[name].astype(object).where(frame[name].notna(), USAGE_ANY).astype(str).to_numpy(dtype=object)
+    
+    return (
+        text('device_model'),
+        text('operating_system'),
+        feature_values(frame, 'age', 30),
+        feature_values(frame, 'number_of_apps_installed', 50),
+    )
+
+def predict_usage_values(table, devices, oses, ages, apps):
+    """Evaluate the usage regressions for arrays of records; returns {response key: array}"""
+    n = len(apps)
+    bands = age_bands(ages)
+    anything = np.full(n, USAGE_ANY, dtype=object)
+    
+    # Most specific fitted row per record: segment, then age band, then whole dataset
+    rows = table.index.get_indexer(pd.MultiIndex.from_arrays([devices, oses, bands]))
+    band_rows = table.index.get_indexer(pd.MultiIndex.from_arrays([anything, anything, bands]))
+    rows = np.where(rows >= 0, rows, band_rows)
+    rows = np.where(rows >= 0, rows, table.index.get_loc((USAGE_ANY, USAGE_ANY, USAGE_ANY)))
+    
+    coefficients = table.iloc[rows]
+    predictions = {}
+    for key, (col, decimals) in USAGE_TARGETS.items():
+        values = coefficients['intercept_' + col].to_numpy() + coefficients['slope_' + col].to_numpy() * apps
+        predictions[key] = np.round(np.maximum(values, 0), decimals)
+    return predictions
 
 @app.route('/api/predict/usage', methods=['POST'])
 def predict_usage():
@@ -402,32 +3160,35 @@ def predict_usage():
     if not data:
         return error_response('No data provided', 400, 'NO_DATA')
     
-    df = load_data()
-    
-    # Use dataset statistics as base for predictions
-    apps = data.get('number_of_apps_installed', 50)
-    age = data.get('age', 30)
-    
-    # Simple regression-like predictions based on correlations
-    base_screen_time = float(df['Screen_On_Time'].mean())
-    base_app_usage = float(df['App_Usage_Time'].mean())
-    base_data_usage = float(df['Data_Usage'].mean())
-    base_battery = float(df['Battery_Drain'].mean())
-    
-    # Adjust based on apps installed (more apps = more usage)
-    apps_factor = apps / df['Number_of_Apps_Installed'].mean()
+    try:
+        features = usage_features(pd.DataFrame([data]).rename(columns=lambda col: str(col).lower()))
+    except (ValueError, TypeError) as e:
+        return error_response(str(e), 400, 'INVALID_FEATURES')
     
-    # Adjust based on age (younger = slightly more usage)
-    age_factor = 1.2 if age < 30 else (1.0 if age < 45 else 0.8)
+    # Evaluate the per-segment regression fitted once for this dataset version
+    version, df = resolve_dataset()
+    predictions = predict_usage_values(get_usage_model(version, df), *features)
     
-    predictions = {
-        'predicted_screen_time': round(base_screen_time * apps_factor * age_factor, 2),
-        'predicted_app_usage': round(base_app_usage * apps_factor * age_factor, 0),
-        'predicted_data_usage': round(base_data_usage * apps_factor, 0),
-        'predicted_battery_drain': round(base_battery * apps_factor, 0),
-    }
+    return success_response({key: values[0].item() for key, values in predictions.items()})
+
+@app.route('/api/predict/usage/batch', methods=['POST'])
+def predict_usage_batch():
+    """
+    Predict usage metrics for many records in one vectorized pass
     
-    return success_response(predictions)
+    Accepts a JSON array of records shaped like /api/predict/usage input
+    (optionally wrapped as {"records": [...]}), or a CSV uploaded as the form
+    field `file`. The response is columnar, aligned with the input rows.
+    """
+    try:
+        frame = read_batch_records()
+        features = usage_features(frame)
+    except (ValueError, TypeError, pd.errors.ParserError, pd.errors.EmptyDataError) as e:
+        return error_response(str(e), 400, 'INVALID_BATCH')
+    
+    version, df = resolve_dataset()
+    predictions = predict_usage_values(get_usage_model(version, df), *features)
+    return success_response({key: values.tolist() for key, values in predictions.items()})
 
 # ============ Simulation Endpoint ============
 
@@ -450,16 +3211,14 @@ def simulate():
     if not data:
         return error_response('No data provided', 400, 'NO_DATA')
     
-    df = load_data()
+    version, df = resolve_dataset()
     user_id = data.get('base_user_id')
     changes = data.get('changes', {})
     
-    user = df[df['User_ID'] == user_id]
-    if user.empty:
+    user_data = find_user_row(version, df, user_id)
+    if user_data is None:
         return error_response(f'User {user_id} not found', 404, 'USER_NOT_FOUND')
     
-    user_data = user.iloc[0]
-    
     # Original values
     original = {
         'behavior_class': int(user_data['User_Behavior_Class']),
@@ -470,7 +3229,7 @@ def simulate():
     
     # Apply changes and predict new values
     apps_delta = changes.get('apps_installed_delta', 0)
-    new_apps = user_data['Number_of_Apps_Installed'] + apps_delta
+    new_apps = max(user_data['Number_of_Apps_Installed'] + apps_delta, 0)  # Removing more apps than installed leaves none, as in the sweep
     
     # Simple prediction based on correlation with apps
     apps_ratio = new_apps / user_data['Number_of_Apps_Installed'] if user_data['Number_of_Apps_Installed'] > 0 else 1
@@ -496,37 +3255,210 @@ def simulate():
         'changes': change_values,
     })
 
+# Simulated metrics: (source column, exponent applied to the apps ratio, decimals)
+SWEEP_METRICS = {
+    'screen_time': ('Screen_On_Time', 0.3, 2),
+    'battery_drain': ('Battery_Drain', 0.5, 0),
+    'data_usage': ('Data_Usage', 0.4, 0),
+}
+SWEEP_PERCENTILES = [10, 50, 90]
+
+def build_segment_means(df):
+    """Mean of each simulated metric per device, per OS and per device/OS pair"""
+    columns = [col for col, _, _ in SWEEP_METRICS.values()]
+    values = df[['Device_Model', 'Operating_System']].assign(**{col: column_values(df[col]) for col in columns})
+    return {
+        keys: values.groupby(list(keys), observed=True)[columns].mean()
+        for keys in [('Device_Model',), ('Operating_System',), ('Device_Model', 'Operating_System')]
+    }
+
+def get_segment_means(version, df):
+    """Return the per-segment metric means for a dataset version, building them on first use"""
+    return analytics_cache.get_or_compute(version, 'segment_means', lambda: build_segment_means(df))
+
+def switch_factors(segment_means, df, rows, device, os_name):
+    """
+    Multiplier per user and metric for switching to another device and/or OS
+
+    The factor is the metric mean of the target segment divided by the mean of
+    the user's current segment at the same granularity. Raises ValueError for
+    a target segment that does not occur in the dataset.
+    """
+    keys = tuple(col for col, value in [('Device_Model', device), ('Operating_System', os_name)] if value is not None)
+    if not keys:
+        return np.ones((len(rows), len(SWEEP_METRICS)))
+    means = segment_means[keys]
+    target = tuple(value for value in (device, os_name) if value is not None)
+    target = target if len(keys) > 1 else target[0]
+    if target not in means.index:
+        raise ValueError(f'No users with {", ".join(map(str, np.atleast_1d(target)))} in the dataset')
+    current = pd.MultiIndex.from_arrays([column_values(df[col], rows) for col in keys]) if len(keys) > 1 \
+        else pd.Index(column_values(df[keys[0]], rows))
+    return means.loc[target].to_numpy(dtype=float) / means.to_numpy(dtype=float)[means.index.get_indexer(current)]
+
+def select_cohort(version, df, data):
+    """Row positions of the sweep cohort: explicit user_ids, a /api/users style filter, or everyone"""
+    if 'user_ids' in data:
+        user_ids = data['user_ids']
+        if not isinstance(user_ids, list) or not all(isinstance(v, int) for v in user_ids):
+            raise ValueError('user_ids must be a list of integers')
+        positions = lookup_user_positions(version, df, user_ids)
+        return positions[positions >= 0]
+    filters = data.get('filter') or {}
+    if not isinstance(filters, dict):
+        raise ValueError('filter must be an object of column filters')
+    args = {
+        key: ','.join(map(str, value)) if isinstance(value, list) else str(value)
+        for key, value in filters.items()
+    }
+    return select_user_rows(df, args)
+
+@app.route('/api/simulate/sweep', methods=['POST'])
+def simulate_sweep():
+    """
+    Run the what-if simulation for a cohort of users across a grid of changes
+
+    Expected JSON body:
+    {
+        "user_ids": [1, 2, 3],                  (or "filter": {"Operating_System": "Android", "min_Age": 25};
+                                                  omit both to simulate every user)
+        "grid": {
+            "apps_installed_delta": [0, 10, 20],
+            "device_model": [null, "iPhone 12"],
+            "operating_system": [null, "iOS"]
+        },
+        "include_users": false
+    }
+
+    Every combination of the grid values is evaluated for every user at once.
+    `null` keeps the user's current device or OS; switching applies the ratio
+    of the target segment's mean metrics to the user's current segment. The
+    response summarizes each scenario's distribution and, when include_users
+    is set, returns per-user outcomes as [user][scenario] arrays.
+    """
+    data = request.get_json()
+    if not data:
+        return error_response('No data provided', 400, 'NO_DATA')
+    
+    grid = data.get('grid') or {}
+    deltas = grid.get('apps_installed_delta', [0])
+    devices = grid.get('device_model', [None])
+    oses = grid.get('operating_system', [None])
+    if not all(isinstance(v, list) and v for v in (deltas, devices, oses)):
+        return error_response('Grid values must be non-empty lists', 400, 'INVALID_GRID')
+    if not all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in deltas):
+        return error_response('apps_installed_delta values must be numbers', 400, 'INVALID_GRID')
+    
+    version, df = resolve_dataset()
+    try:
+        rows = select_cohort(version, df, data)
+    except ValueError as e:
+        return error_response(str(e), 400, 'INVALID_COHORT')
+    
+    switches = [(device, os_name) for device in devices for os_name in oses]
+    scenarios = len(deltas) * len(switches)
+    include_users = bool(data.get('include_users'))
+    if len(rows) * scenarios > SWEEP_MAX_CELLS:
+        return error_response(f'Sweep exceeds {SWEEP_MAX_CELLS} user x scenario combinations', 400, 'SWEEP_TOO_LARGE')
+    if include_users and len(rows) > SWEEP_MAX_USER_ROWS:
+        return error_response(f'include_users supports at most {SWEEP_MAX_USER_ROWS} users', 400, 'SWEEP_TOO_LARGE')
+    
+    segment_means = get_segment_means(version, df)
+    try:
+        # (users, switches, metrics)
+        factors = np.stack([switch_factors(segment_means, df, rows, d, o) for d, o in switches], axis=1)
+    except ValueError as e:
+        return error_response(str(e), 400, 'INVALID_GRID')
+    
+    # Broadcast users along axis 0, apps deltas along axis 1 and device/OS switches along axis 2
+    delta = np.asarray(deltas, dtype=float)[None, :, None]
+    apps = df['Number_of_Apps_Installed'].to_numpy(dtype=float)[rows][:, None, None]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        apps_ratio = np.where(apps > 0, np.maximum(apps + delta, 0) / apps, 1.0)
+    
+    original_class = df['User_Behavior_Class'].to_numpy(dtype=float)[rows][:, None, None]
+    outcomes = {
+        'behavior_class': np.broadcast_to(
+            np.clip(original_class + np.floor_divide(delta, 15), 1, 5), (len(rows), len(deltas), len(switches))
+        ),
+    }
+    originals = {'behavior_class': original_class[:, 0, 0]}
+    for i, (key, (col, exponent, decimals)) in enumerate(SWEEP_METRICS.items()):
+        original = column_values(df[col], rows).astype(float)
+        originals[key] = original
+        outcomes[key] = np.round(original[:, None, None] * apps_ratio ** exponent * factors[:, None, :, i], decimals)
+    
+    # Flatten the grid so scenario j is deltas[j // len(switches)] with switches[j % len(switches)]
+    outcomes = {key: values.reshape(len(rows), scenarios) for key, values in outcomes.items()}
+    summary = []
+    for j in range(scenarios):
+        device, os_name = switches[j % len(switches)]
+        entry = {
+            'apps_installed_delta': deltas[j // len(switches)],
+            'device_model': device,
+            'operating_system': os_name,
+        }
+        classes = outcomes['behavior_class'][:, j].astype(int)
+        entry['behavior_class_counts'] = {
+            str(cls): int(count) for cls, count in enumerate(np.bincount(classes, minlength=6)) if cls >= 1
+        }
+        summary.append(entry)
+    if len(rows):
+        for key in SWEEP_METRICS:
+            values = outcomes[key]
+            change = values - originals[key][:, None]
+            means = values.mean(axis=0)
+            mean_changes = change.mean(axis=0)
+            quantiles = np.percentile(values, SWEEP_PERCENTILES, axis=0)
+            for j, entry in enumerate(summary):
+                entry[key] = {
+                    'mean': float(means[j]),
+                    'mean_change': float(mean_changes[j]),
+                    **{f'p{p}': float(quantiles[k, j]) for k, p in enumerate(SWEEP_PERCENTILES)},
+                }
+    
+    result = {
+        'users': int(len(rows)),
+        'scenarios': summary,
+    }
+    if include_users:
+        result['per_user'] = {
+            'user_ids': column_values(df['User_ID'], rows).tolist(),
+            'original': {key: values.tolist() for key, values in originals.items()},
+            **{key: values.tolist() for key, values in outcomes.items()},
+        }
+    return success_response(result)
+
 # ============ Role-Specific Insights ============
 
 @app.route('/api/insights/individual/<int:user_id>', methods=['GET'])
+@dataset_etag
 def get_individual_insights(user_id):
-    """Get personalized insights for an individual user"""
-    df = load_data()
-    user = df[df['User_ID'] == user_id]
+    """Get personalized insights for an individual user (`?approx=true` ranks against quantile sketches)"""
+    version, df = resolve_dataset()
+    user_data = find_user_row(version, df, user_id)
     
-    if user.empty:
+    if user_data is None:
         return error_response(f'User {user_id} not found', 404, 'USER_NOT_FOUND')
     
-    user_data = user.iloc[0]
+    rank_index = get_rank_index(version, df, wants_approx())
     
     # Calculate percentiles
     percentiles = {
-        'screen_time': float((df['Screen_On_Time'] <= user_data['Screen_On_Time']).mean() * 100),
-        'app_usage': float((df['App_Usage_Time'] <= user_data['App_Usage_Time']).mean() * 100),
-        'data_usage': float((df['Data_Usage'] <= user_data['Data_Usage']).mean() * 100),
-        'battery_drain': float((df['Battery_Drain'] <= user_data['Battery_Drain']).mean() * 100),
+        key: float(compute_percentiles(rank_index, col, [user_data[col]])[0])
+        for key, col in PERCENTILE_COLUMNS.items()
     }
     
     # Calculate wellness score (lower usage = higher score)
-    wellness_score = max(0, min(100, 100 - (user_data['Screen_On_Time'] / 12 * 100)))
+    wellness_score = compute_wellness_scores([user_data['Screen_On_Time']])[0]
     
     # Generate recommendations
     recommendations = []
-    if user_data['Screen_On_Time'] > df['Screen_On_Time'].median():
+    if user_data['Screen_On_Time'] > rank_index['screen_time_median']:
         recommendations.append('Consider setting daily screen time limits')
-    if user_data['Number_of_Apps_Installed'] > df['Number_of_Apps_Installed'].quantile(0.75):
+    if user_data['Number_of_Apps_Installed'] > rank_index['apps_installed_p75']:
         recommendations.append('Review and uninstall unused apps to improve battery life')
-    if user_data['Battery_Drain'] > df['Battery_Drain'].median():
+    if user_data['Battery_Drain'] > rank_index['battery_drain_median']:
         recommendations.append('Enable battery saver mode during low usage periods')
     if wellness_score < 50:
         recommendations.append('Take regular breaks every 30 minutes of screen time')
@@ -540,74 +3472,115 @@ def get_individual_insights(user_id):
         'recommendations': recommendations,
     })
 
-@app.route('/api/insights/developer', methods=['GET'])
-def get_developer_insights():
-    """Get insights for app developers"""
-    df = load_data()
+@app.route('/api/insights/individual/batch', methods=['POST'])
+def get_individual_insights_batch():
+    """
+    Get percentiles and wellness scores for many users in one call
+
+    Expected JSON body:
+    {
+        "user_ids": [1, 2, 3]
+    }
+
+    Results are columnar: every list is aligned with the returned `user_ids`.
+    Pass `?approx=true` to rank against the quantile sketches.
+    """
+    data = request.get_json()
+    if not data:
+        return error_response('No data provided', 400, 'NO_DATA')
+    
+    user_ids = data.get('user_ids')
+    if not isinstance(user_ids, list) or not all(isinstance(v, int) for v in user_ids):
+        return error_response('user_ids must be a list of integers', 400, 'INVALID_USER_IDS')
+    if len(user_ids) > INSIGHTS_BATCH_MAX:
+        return error_response(f'At most {INSIGHTS_BATCH_MAX} user_ids can be requested at once', 400, 'TOO_MANY_USER_IDS')
+    
+    version, df = resolve_dataset()
+    rank_index = get_rank_index(version, df, wants_approx())
+    positions = lookup_user_positions(version, df, user_ids)
+    found = positions >= 0
+    rows = positions[found]
+    
+    return success_response({
+        'user_ids': np.asarray(user_ids, dtype=np.int64)[found].tolist(),
+        'wellness_score': np.round(compute_wellness_scores(column_values(df['Screen_On_Time'], rows)), 1),
+        'percentiles': {
+            key: compute_percentiles(rank_index, col, column_values(df[col], rows))
+            for key, col in PERCENTILE_COLUMNS.items()
+        },
+        'missing': [user_id for user_id, ok in zip(user_ids, found) if not ok],
+    })
+
+def compute_developer_insights(aggregates):
+    """Compute the app developer insights payload"""
+    classes = aggregates.segment_table('User_Behavior_Class')
+    os_by_class = aggregates.cross_counts('User_Behavior_Class', 'Operating_System')
     
     # User segments analysis
     segments = {}
     for cls in range(1, 6):
-        segment_df = df[df['User_Behavior_Class'] == cls]
-        if not segment_df.empty:
+        if cls in classes.index:
+            # Most common OS, ties resolved to the first in sort order like Series.mode
+            os_counts = os_by_class.loc[cls]
+            os_counts = os_counts[os_counts > 0].sort_index()
             segments[cls] = {
-                'count': len(segment_df),
-                'avg_app_usage': float(segment_df['App_Usage_Time'].mean()),
-                'avg_apps_installed': float(segment_df['Number_of_Apps_Installed'].mean()),
-                'dominant_os': segment_df['Operating_System'].mode().iloc[0] if len(segment_df) > 0 else 'Unknown',
+                'count': int(classes.at[cls, 'rows']),
+                'avg_app_usage': float(classes.at[cls, 'mean_App_Usage_Time']),
+                'avg_apps_installed': float(classes.at[cls, 'mean_Number_of_Apps_Installed']),
+                'dominant_os': os_counts.idxmax() if len(os_counts) else 'Unknown',
             }
     
     # Engagement metrics
+    class_rows = classes['rows']
     engagement = {
-        'high_engagement_users': len(df[df['User_Behavior_Class'] >= 4]),
-        'moderate_engagement_users': len(df[df['User_Behavior_Class'] == 3]),
-        'low_engagement_users': len(df[df['User_Behavior_Class'] <= 2]),
-        'avg_daily_app_usage_mins': float(df['App_Usage_Time'].mean()),
+        'high_engagement_users': int(class_rows[class_rows.index >= 4].sum()),
+        'moderate_engagement_users': int(class_rows[class_rows.index == 3].sum()),
+        'low_engagement_users': int(class_rows[class_rows.index <= 2].sum()),
+        'avg_daily_app_usage_mins': aggregates.column_mean('App_Usage_Time'),
     }
     
     # Device optimization priorities
-    device_stats = df.groupby('Device_Model').agg({
-        'App_Usage_Time': 'mean',
-        'User_ID': 'count'
-    }).rename(columns={'User_ID': 'user_count'})
-    
     device_optimization = {
         device: {
-            'user_count': int(stats['user_count']),
-            'avg_usage': float(stats['App_Usage_Time']),
+            'user_count': int(stats['rows']),
+            'avg_usage': float(stats['mean_App_Usage_Time']),
         }
-        for device, stats in device_stats.iterrows()
+        for device, stats in aggregates.segment_table('Device_Model').iterrows()
     }
     
-    return success_response({
+    return {
         'user_segments': segments,
         'engagement_metrics': engagement,
         'device_optimization': device_optimization,
-    })
+    }
 
-@app.route('/api/insights/telecom', methods=['GET'])
-def get_telecom_insights():
-    """Get insights for telecom providers"""
-    df = load_data()
-    
+@app.route('/api/insights/developer', methods=['GET'])
+@dataset_etag
+def get_developer_insights():
+    """Get insights for app developers"""
+    return success_response(get_analytics_snapshot(current_dataset_version())['developer'])
+
+def compute_telecom_insights(aggregates):
+    """Compute the telecom provider insights payload"""
     # Total data traffic
-    total_traffic = float(df['Data_Usage'].sum())
+    total_traffic = float(aggregates.segments['User_Behavior_Class']['sum'][:, AGGREGATE_COLUMNS.index('Data_Usage')].sum())
     
     # Segment breakdown
+    classes = aggregates.segment_table('User_Behavior_Class')
     segment_breakdown = {}
     for cls in range(1, 6):
-        segment_df = df[df['User_Behavior_Class'] == cls]
-        if not segment_df.empty:
+        if cls in classes.index:
+            user_count = int(classes.at[cls, 'rows'])
             segment_breakdown[cls] = {
-                'user_count': len(segment_df),
-                'total_data_mb': float(segment_df['Data_Usage'].sum()),
-                'avg_data_mb': float(segment_df['Data_Usage'].mean()),
-                'percentage': round(len(segment_df) / len(df) * 100, 1),
+                'user_count': user_count,
+                'total_data_mb': float(classes.at[cls, 'sum_Data_Usage']),
+                'avg_data_mb': float(classes.at[cls, 'mean_Data_Usage']),
+                'percentage': round(user_count / aggregates.rows * 100, 1),
             }
     
     # Network load by device
-    network_load = df.groupby('Device_Model')['Data_Usage'].sum().to_dict()
-    network_load = {k: float(v) for k, v in network_load.items()}
+    devices = aggregates.segment_table('Device_Model')
+    network_load = {k: float(v) for k, v in devices['sum_Data_Usage'].items()}
     
     # Pricing recommendations
     recommendations = [
@@ -616,57 +3589,390 @@ def get_telecom_insights():
         'Android users show higher data consumption - optimize network for Android devices',
     ]
     
-    return success_response({
+    return {
         'total_data_traffic': total_traffic,
         'segment_breakdown': segment_breakdown,
         'network_load': network_load,
         'pricing_recommendations': recommendations,
-    })
+    }
 
-@app.route('/api/insights/researcher', methods=['GET'])
-def get_researcher_insights():
-    """Get insights for behavioral researchers"""
-    df = load_data()
-    
+@app.route('/api/insights/telecom', methods=['GET'])
+@dataset_etag
+def get_telecom_insights():
+    """Get insights for telecom providers"""
+    return success_response(get_analytics_snapshot(current_dataset_version())['telecom'])
+
+def compute_researcher_insights(aggregates, medians):
+    """Compute the behavioral researcher insights payload"""
     # Correlation analysis
-    numeric_cols = ['App_Usage_Time', 'Screen_On_Time', 'Battery_Drain', 
-                    'Number_of_Apps_Installed', 'Data_Usage', 'Age', 'User_Behavior_Class']
-    corr_matrix = df[numeric_cols].corr()
+    corr_matrix = aggregates.correlation()
     
     correlations = {}
     target = 'User_Behavior_Class'
-    for col in numeric_cols:
+    for col in AGGREGATE_COLUMNS:
         if col != target:
             correlations[col] = round(float(corr_matrix.loc[col, target]), 3)
     
     # Statistical summary
     stats_summary = {}
-    for col in numeric_cols:
+    for i, col in enumerate(AGGREGATE_COLUMNS):
+        present = aggregates.count[i] > 0
         stats_summary[col] = {
-            'mean': float(df[col].mean()),
-            'std': float(df[col].std()),
-            'min': float(df[col].min()),
-            'max': float(df[col].max()),
-            'median': float(df[col].median()),
+            'mean': aggregates.column_mean(col),
+            'std': aggregates.std(col),
+            'min': float(aggregates.min[i]) if present else float('nan'),
+            'max': float(aggregates.max[i]) if present else float('nan'),
+            'median': medians[col],
         }
     
     # Behavior profiles
+    classes = aggregates.segment_table('User_Behavior_Class')
+    gender_by_class = aggregates.cross_counts('User_Behavior_Class', 'Gender')
     behavior_profiles = {}
     for cls in range(1, 6):
-        segment_df = df[df['User_Behavior_Class'] == cls]
-        if not segment_df.empty:
+        if cls in classes.index:
             behavior_profiles[cls] = {
-                'avg_screen_time': float(segment_df['Screen_On_Time'].mean()),
-                'avg_app_usage': float(segment_df['App_Usage_Time'].mean()),
-                'avg_apps': float(segment_df['Number_of_Apps_Installed'].mean()),
-                'avg_age': float(segment_df['Age'].mean()),
-                'gender_ratio': segment_df['Gender'].value_counts().to_dict(),
+                'avg_screen_time': float(classes.at[cls, 'mean_Screen_On_Time']),
+                'avg_app_usage': float(classes.at[cls, 'mean_App_Usage_Time']),
+                'avg_apps': float(classes.at[cls, 'mean_Number_of_Apps_Installed']),
+                'avg_age': float(classes.at[cls, 'mean_Age']),
+                'gender_ratio': {k: int(v) for k, v in gender_by_class.loc[cls].items() if v > 0},
             }
     
-    return success_response({
+    return {
         'correlations': correlations,
         'statistical_summary': stats_summary,
         'behavior_profiles': behavior_profiles,
+    }
+
+@app.route('/api/insights/researcher', methods=['GET'])
+@dataset_etag
+def get_researcher_insights():
+    """Get insights for behavioral researchers (`?approx=true` for sketch-based medians)"""
+    return success_response(get_researcher_snapshot(current_dataset_version(), wants_approx()))
+
+# Snapshot sections served by the insights bundle
+BUNDLE_SECTIONS = ['stats', 'devices', 'os', 'behavior', 'demographics', 'developer', 'telecom', 'researcher']
+
+@app.route('/api/insights/bundle', methods=['GET'])
+@dataset_etag
+def get_insights_bundle():
+    """
+    Get the dashboard stats and every role's insights in one response
+    
+    Query parameters:
+    - sections: comma-separated subset of stats, devices, os, behavior,
+      demographics, developer, telecom, researcher (default: all)
+    - approx: true for sketch-based medians in the researcher section
+    """
+    sections = request.args.get('sections')
+    sections = [s.strip() for s in sections.split(',') if s.strip()] if sections else BUNDLE_SECTIONS
+    unknown = [s for s in sections if s not in BUNDLE_SECTIONS]
+    if unknown:
+        return error_response(f'Unknown sections: {", ".join(unknown)}', 400, 'INVALID_SECTIONS')
+    
+    version = current_dataset_version()
+    snapshot = get_analytics_snapshot(version)
+    if 'researcher' in sections:
+        snapshot = dict(snapshot, researcher=get_researcher_snapshot(version, wants_approx()))
+    return success_response({section: snapshot[section] for section in sections})
+
+# ============ Background Jobs ============
+
+# Job kinds, each run as a request to an existing endpoint so results keep its response shape
+JOB_KINDS = {
+    'users_export': ('GET', '/api/users'),
+    'stats': ('GET', '/api/stats'),
+    'query': ('GET', '/api/query'),
+    'cube': ('GET', '/api/cube'),
+    'quantiles': ('GET', '/api/analytics/quantiles'),
+    'insights_bundle': ('GET', '/api/insights/bundle'),
+    'insights_developer': ('GET', '/api/insights/developer'),
+    'insights_telecom': ('GET', '/api/insights/telecom'),
+    'insights_researcher': ('GET', '/api/insights/researcher'),
+    'insights_batch': ('POST', '/api/insights/individual/batch'),
+    'predict_behavior_batch': ('POST', '/api/predict/behavior/batch'),
+    'predict_usage_batch': ('POST', '/api/predict/usage/batch'),
+    'simulate_sweep': ('POST', '/api/simulate/sweep'),
+}
+JOB_FINISHED = {'done', 'failed', 'cancelled'}
+
+class JobCancelled(Exception):
+    """A running job found its cancel marker"""
+
+class JobDatasetChanged(Exception):
+    """The job's dataset file no longer holds the version it was submitted for"""
+
+def job_dir(job_id):
+    return JOBS_DIR / job_id
+
+def read_job(job_id):
+    """The job's state as last written, or None for an unknown ID"""
+    try:
+        with open(job_dir(job_id) / 'job.json') as f:
+            return json.load(f)
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+
+def write_job(job):
+    """Atomically replace a job's state file, so pollers never read a partial write"""
+    path = job_dir(job['id']) / 'job.json'
+    staging = path.with_name(f'job.json.tmp-{os.getpid()}-{threading.get_ident()}')
+    with open(staging, 'w') as f:
+        json.dump(job, f)
+    os.replace(staging, path)
+
+def update_job(job, **changes):
+    job.update(changes)
+    write_job(job)
+    if os.path.exists(job_dir(job['id']) / 'cancel') and job['status'] not in JOB_FINISHED:
+        raise JobCancelled()
+
+def check_job_dataset(version):
+    """Raise JobDatasetChanged when the dataset file no longer holds the job's version"""
+    try:
+        changed = dataset_version(version[0]) != version
+    except FileNotFoundError:
+        changed = True
+    if changed:
+        raise JobDatasetChanged('The dataset changed after the job was submitted; submit it again')
+
+def run_job(job_id):
+    """
+    Run a job in a pool process
+
+    The job's endpoint is dispatched in a request context pinned to the
+    dataset version seen at submission. A file that was re-uploaded or
+    appended to since then fails the job, as the old rows are gone. Progress
+    is reported in stages, and per batch of rows for streamed exports; the
+    cancel marker is checked at each of those points.
+    """
+    job = read_job(job_id)
+    directory = job_dir(job_id)
+    version = tuple(job['dataset_version'])
+    try:
+        update_job(job, status='running', stage='loading', progress=0.0, started_at=time.time())
+        check_job_dataset(version)
+        dataset_cache.get(version)
+        check_job_dataset(version)  # So rows of a newer file are never served under the old version
+        update_job(job, stage='computing', progress=0.1)
+
+        method, path = JOB_KINDS[job['kind']]
+        body = (directory / 'input.json').read_bytes() if method == 'POST' else None
+        with app.test_request_context(path, method=method, query_string=job['query'], data=body,
+                                      content_type='application/json'):
+            g.dataset_version = version
+            response = app.full_dispatch_request()
+            result = directory / ('result.ndjson' if response.is_streamed else 'result.json')
+            with open(result, 'wb') as f:
+                if response.is_streamed:
+                    total = max(int(response.headers.get('X-Total-Count', 0)), 1)
+                    written = 0
+                    for chunk in response.response:
+                        f.write(chunk)
+                        written += chunk.count(b'\n')
+                        update_job(job, stage='writing', progress=0.1 + 0.9 * written / total)
+                else:
+                    f.write(response.get_data())
+        update_job(
+            job,
+            status='done' if response.status_code == 200 else 'failed',
+            stage='finished',
+            progress=1.0,
+            finished_at=time.time(),
+            result={'file': result.name, 'bytes': result.stat().st_size,
+                    'mimetype': response.mimetype, 'status_code': response.status_code},
+            error=None if response.status_code == 200 else (response.get_json(silent=True) or {}).get('message'),
+        )
+    except JobCancelled:
+        job.update(status='cancelled', finished_at=time.time())
+        write_job(job)
+    except Exception as e:
+        job.update(status='failed', finished_at=time.time(), error=str(e))
+        write_job(job)
+
+class JobQueue:
+    """
+    Bounded queue of background jobs run on a process pool
+
+    Job state lives in JOBS_DIR, so any worker can report on or cancel a job
+    submitted to another. Each worker owns its own pool, created on first use,
+    and accepts at most `max_pending` queued or running jobs.
+    """
+
+    def __init__(self, max_workers=JOB_WORKERS, max_pending=JOB_QUEUE_MAX):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._executor = None
+        self._futures = {}  # job ID -> Future of the jobs this worker submitted
+        self._lock = threading.Lock()
+
+    def submit(self, kind, owner, version, query, body=None):
+        """Persist and enqueue a job; returns its state, or None when the queue is full"""
+        with self._lock:
+            self._futures = {job_id: f for job_id, f in self._futures.items() if not f.done()}
+            if len(self._futures) >= self.max_pending:
+                return None
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            job = {
+                'id': uuid.uuid4().hex,
+                'kind': kind,
+                'owner': owner,
+                'dataset_version': [str(version[0]), version[1], version[2]],
+                'query': query,
+                'status': 'queued',
+                'stage': 'queued',
+                'progress': 0.0,
+                'submitted_at': time.time(),
+            }
+            job_dir(job['id']).mkdir(parents=True)
+            if body is not None:
+                (job_dir(job['id']) / 'input.json').write_bytes(body)
+            write_job(job)
+            self._futures[job['id']] = self._executor.submit(run_job, job['id'])
+            return job
+
+    def cancel(self, job):
+        """Cancel a job: dequeue it if it has not started, otherwise ask it to stop"""
+        (job_dir(job['id']) / 'cancel').touch()
+        with self._lock:
+            future = self._futures.get(job['id'])
+        if future is not None and future.cancel():
+            job.update(status='cancelled', finished_at=time.time())
+            write_job(job)
+        return read_job(job['id'])
+
+    def pending(self):
+        with self._lock:
+            return sum(not f.done() for f in self._futures.values())
+
+job_queue = JobQueue()
+
+def remove_expired_jobs():
+    """Delete finished jobs, and their results, older than JOB_RETENTION"""
+    if not JOBS_DIR.exists():
+        return
+    cutoff = time.time() - JOB_RETENTION
+    for directory in JOBS_DIR.iterdir():
+        job = read_job(directory.name)
+        if job is not None and job['status'] in JOB_FINISHED and job.get('finished_at', 0) < cutoff:
+            shutil.rmtree(directory, ignore_errors=True)
+
+def find_caller_job(job_id):
+    """Return (job, None), or (None, error response) when the ID is unknown or owned by someone else"""
+    job = read_job(job_id) if re.fullmatch(r'[0-9a-f]{32}', job_id) else None
+    user = get_user_from_token()
+    if job is None or job['owner'] != (user['id'] if user else None):
+        return None, error_response(f'Job {job_id} not found', 404, 'JOB_NOT_FOUND')
+    return job, None
+
+def job_status(job):
+    """The job fields returned to clients"""
+    return {key: value for key, value in job.items() if key not in ('owner', 'dataset_version')}
+
+@app.route('/api/jobs', methods=['POST'])
+def submit_job():
+    """
+    Submit a background job
+
+    Expected JSON body:
+    {
+        "kind": "insights_researcher",      (one of JOB_KINDS)
+        "query": {"Operating_System": "iOS"},  Query parameters of the underlying endpoint
+        "body": {...}                       JSON body of POST endpoints, e.g. the sweep request
+    }
+
+    The job runs against the caller's dataset as of submission. Responds 202
+    with the job; poll GET /api/jobs/<id> and fetch GET /api/jobs/<id>/result.
+    """
+    data = request.get_json(silent=True)
+    if not data:
+        return error_response('No data provided', 400, 'NO_DATA')
+    kind = data.get('kind')
+    if kind not in JOB_KINDS:
+        return error_response(f'kind must be one of {", ".join(JOB_KINDS)}', 400, 'INVALID_JOB')
+    query = data.get('query') or {}
+    if not isinstance(query, dict):
+        return error_response('query must be an object', 400, 'INVALID_JOB')
+    query = {str(key): str(value) for key, value in query.items()}
+    if kind == 'users_export':
+        query['format'] = 'ndjson'  # Streamed, so progress is reported per batch of rows
+    body = None
+    if JOB_KINDS[kind][0] == 'POST':
+        if data.get('body') is None:
+            return error_response(f'{kind} jobs need a body', 400, 'INVALID_JOB')
+        body = app.json.dumps(data['body']).encode()
+
+    remove_expired_jobs()
+    user = get_user_from_token()
+    job = job_queue.submit(kind, user['id'] if user else None, current_dataset_version(), query, body)
+    if job is None:
+        return error_response(f'Too many pending jobs (limit {JOB_QUEUE_MAX}), try again later', 429, 'JOB_QUEUE_FULL')
+    return success_response(job_status(job), 'Job submitted'), 202, {'Location': f'/api/jobs/{job["id"]}'}
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Get a job's status and progress"""
+    job, error = find_caller_job(job_id)
+    return error or success_response(job_status(job))
+
+@app.route('/api/jobs/<job_id>/result', methods=['GET'])
+def get_job_result(job_id):
+    """Download a finished job's result, with the underlying endpoint's status code"""
+    job, error = find_caller_job(job_id)
+    if error:
+        return error
+    if job['status'] not in ('done', 'failed') or not job.get('result'):
+        return error_response(f'Job is {job["status"]}', 409, 'JOB_NOT_FINISHED', {'job': job_status(job)})
+    result = job['result']
+    response = send_file(job_dir(job_id) / result['file'], mimetype=result['mimetype'])
+    response.status_code = result['status_code']
+    return response
+
+@app.route('/api/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    """Cancel a queued or running job"""
+    job, error = find_caller_job(job_id)
+    if error:
+        return error
+    if job['status'] in JOB_FINISHED:
+        return error_response(f'Job is already {job["status"]}', 409, 'JOB_FINISHED')
+    return success_response(job_status(job_queue.cancel(job)), 'Cancellation requested')
+
+# ============ Admin Endpoints ============
+
+@app.route('/api/admin/cache', methods=['GET'])
+def get_cache_stats():
+    """Get dataset and token cache counters"""
+    user = get_user_from_token()
+    if not user:
+        return error_response('Authentication required', 401, 'UNAUTHORIZED')
+    if not is_admin(user):
+        return error_response('Only administrators can inspect the caches', 403, 'FORBIDDEN')
+    
+    return success_response({
+        'datasets': dataset_cache.stats(),
+        'tokens': token_cache.stats(),
+    })
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Get this worker's request metrics in the Prometheus text format"""
+    return Response(request_metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/admin/memory', methods=['GET'])
+def get_memory_usage():
+    """Get the bytes held by each cached dataset, per column"""
+    user = get_user_from_token()
+    if not user:
+        return error_response('Authentication required', 401, 'UNAUTHORIZED')
+    if not is_admin(user):
+        return error_response('Only administrators can inspect dataset memory', 403, 'FORBIDDEN')
+    
+    return success_response({
+        'datasets': dataset_cache.memory(),
+        'cache': dataset_cache.stats(),
     })
 
 # ============ Health Check ============
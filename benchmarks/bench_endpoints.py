@@ -0,0 +1,214 @@
+"""
+Endpoint Benchmark Suite
+========================
+Drives the API through the Flask test client against synthetic datasets of
+increasing size and records, per size:
+
+- the cold request time (CSV conversion and first aggregates),
+- latency percentiles, throughput and response size per endpoint,
+- peak resident memory of the process.
+
+Each size runs in its own subprocess so peak memory is measured per size.
+Datasets come from generate_dataset.py and live in a temporary folder, so
+data/, uploads/ and models/ are never touched.
+
+Usage: python benchmarks/bench_endpoints.py [--sizes 1000,100000,1000000] [--repeat 20]
+                                            [--only insights] [--output results.json]
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from generate_dataset import write_dataset  # noqa: E402
+
+PERCENTILES = [50, 90, 99]
+BATCH_SIZE = 1000  # Records or user IDs sent to the batch endpoints
+SWEEP_USERS = 10000  # Cohort size of the simulation sweep
+
+PREDICT_RECORD = {
+    'device_model': 'iPhone 12',
+    'operating_system': 'iOS',
+    'app_usage_time': 300,
+    'screen_on_time': 5.5,
+    'battery_drain': 1500,
+    'number_of_apps_installed': 45,
+    'data_usage': 1000,
+    'age': 30,
+    'gender': 'Male',
+}
+
+def build_cases(rows, rng):
+    """(name, method, url, JSON body) for every benchmarked request"""
+    user_id = int(rng.integers(1, rows + 1))
+    ids = rng.choice(np.arange(1, rows + 1), min(BATCH_SIZE, rows), replace=False).tolist()
+    records = [dict(PREDICT_RECORD, number_of_apps_installed=int(apps)) for apps in rng.integers(10, 100, BATCH_SIZE)]
+    sweep = {
+        'user_ids': ids if rows <= SWEEP_USERS else list(range(1, SWEEP_USERS + 1)),
+        'grid': {
+            'apps_installed_delta': [0, 10, 20],
+            'device_model': [None, 'iPhone 12'],
+            'operating_system': [None, 'iOS'],
+        },
+    }
+    return [
+        ('users_page', 'GET', '/api/users?limit=1000', None),
+        ('users_columns', 'GET', '/api/users?limit=10000&format=columns', None),
+        ('users_filter_sort', 'GET', '/api/users?Operating_System=iOS&min_Age=30&sort=-Data_Usage&limit=100', None),
+        ('users_ids', 'GET', '/api/users?ids=' + ','.join(map(str, ids[:100])), None),
+        ('user', 'GET', f'/api/users/{user_id}', None),
+        ('stats', 'GET', '/api/stats', None),
+        ('devices', 'GET', '/api/analytics/devices', None),
+        ('os', 'GET', '/api/analytics/os', None),
+        ('behavior', 'GET', '/api/analytics/behavior', None),
+        ('demographics', 'GET', '/api/analytics/demographics', None),
+        ('query', 'GET', '/api/query?Operating_System=Android&age_group=25-34&min_Data_Usage=500', None),
+        ('cube', 'GET', '/api/cube?dims=Device_Model,User_Behavior_Class&Gender=Female', None),
+        ('quantiles', 'GET', '/api/analytics/quantiles?column=Data_Usage&q=0.1,0.5,0.9&by=Device_Model', None),
+        ('quantiles_approx', 'GET', '/api/analytics/quantiles?column=Data_Usage&q=0.1,0.5,0.9&approx=true', None),
+        ('insights_individual', 'GET', f'/api/insights/individual/{user_id}', None),
+        ('insights_batch', 'POST', '/api/insights/individual/batch', {'user_ids': ids}),
+        ('insights_developer', 'GET', '/api/insights/developer', None),
+        ('insights_telecom', 'GET', '/api/insights/telecom', None),
+        ('insights_researcher', 'GET', '/api/insights/researcher', None),
+        ('insights_bundle', 'GET', '/api/insights/bundle', None),
+        ('predict_behavior', 'POST', '/api/predict/behavior', PREDICT_RECORD),
+        ('predict_behavior_batch', 'POST', '/api/predict/behavior/batch', records),
+        ('predict_usage', 'POST', '/api/predict/usage', PREDICT_RECORD),
+        ('predict_usage_batch', 'POST', '/api/predict/usage/batch', records),
+        ('simulate', 'POST', '/api/simulate', {'base_user_id': user_id, 'changes': {'apps_installed_delta': 10}}),
+        ('simulate_sweep', 'POST', '/api/simulate/sweep', sweep),
+        ('health', 'GET', '/api/health', None),
+    ]
+
+def send(client, method, url, body):
+    return client.open(url, method=method, json=body)
+
+def time_case(client, method, url, body, repeat):
+    """Latency percentiles (ms), throughput and response size of one request"""
+    response = send(client, method, url, body)  # Warm the dataset and analytics caches
+    if response.status_code != 200:
+        return {'status': response.status_code, 'error': response.get_json(silent=True)}
+    timings = []
+    started = time.perf_counter()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = send(client, method, url, body)
+        timings.append((time.perf_counter() - start) * 1000)
+    elapsed = time.perf_counter() - started
+    return {
+        'status': response.status_code,
+        'bytes': len(response.data),
+        'mean_ms': float(np.mean(timings)),
+        **{f'p{p}_ms': float(np.percentile(timings, p)) for p in PERCENTILES},
+        'max_ms': float(np.max(timings)),
+        'requests_per_s': repeat / elapsed,
+    }
+
+def peak_rss_bytes():
+    """Peak resident set size of this process (ru_maxrss is KB on Linux, bytes on macOS)"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+def run_size(rows, repeat, seed, only):
+    """Benchmark one dataset size in this process; returns its result dict"""
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        # The registry is opened on import, so point it at the temporary folder first
+        os.environ['REGISTRY_PATH'] = str(tmp / 'registry.sqlite3')
+        import app as backend
+
+        backend.DATA_PATH = tmp / 'mobile_usage.csv'
+        backend.UPLOAD_FOLDER = tmp / 'uploads'
+        start = time.perf_counter()
+        write_dataset(backend.DATA_PATH, rows, seed)
+        generate_s = time.perf_counter() - start
+
+        client = backend.app.test_client()
+        baseline_rss = peak_rss_bytes()
+        start = time.perf_counter()
+        assert client.get('/api/stats').status_code == 200
+        cold_ms = (time.perf_counter() - start) * 1000
+
+        rng = np.random.default_rng(seed)
+        endpoints = {}
+        for name, method, url, body in build_cases(rows, rng):
+            if only and not any(word in name for word in only):
+                continue
+            endpoints[name] = time_case(client, method, url, body, repeat)
+        return {
+            'rows': rows,
+            'csv_bytes': os.path.getsize(backend.DATA_PATH),
+            'generate_s': generate_s,
+            'cold_ms': cold_ms,
+            'rss_before_load_bytes': baseline_rss,
+            'peak_rss_bytes': peak_rss_bytes(),
+            'dataset_bytes': backend.dataset_cache.stats()['bytes'],
+            'endpoints': endpoints,
+        }
+
+def print_summary(results):
+    for result in results:
+        print(f'\n{result["rows"]:,} rows: cold {result["cold_ms"]:.0f} ms, '
+              f'peak RSS {result["peak_rss_bytes"] / 2**20:.0f} MB, dataset {result["dataset_bytes"] / 2**20:.1f} MB')
+        print(f'{"endpoint":<26}{"p50 ms":>10}{"p90 ms":>10}{"p99 ms":>10}{"req/s":>10}{"bytes":>12}')
+        for name, timing in result['endpoints'].items():
+            if timing['status'] != 200:
+                print(f'{name:<26}  HTTP {timing["status"]}: {timing["error"]}')
+                continue
+            print(f'{name:<26}{timing["p50_ms"]:>10.2f}{timing["p90_ms"]:>10.2f}{timing["p99_ms"]:>10.2f}'
+                  f'{timing["requests_per_s"]:>10.1f}{timing["bytes"]:>12}')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--sizes', default='1000,10000,100000', help='Comma-separated dataset sizes in rows')
+    parser.add_argument('--repeat', type=int, default=20, help='Timed requests per endpoint')
+    parser.add_argument('--seed', type=int, default=42, help='Seed for the dataset and request parameters')
+    parser.add_argument('--only', default='', help='Comma-separated substrings; only matching endpoints run')
+    parser.add_argument('--output', help='Write the results as JSON to this file')
+    parser.add_argument('--worker', type=int, help=argparse.SUPPRESS)  # Benchmark one size and print JSON
+    args = parser.parse_args()
+    only = [word for word in args.only.split(',') if word]
+
+    if args.worker is not None:
+        json.dump(run_size(args.worker, args.repeat, args.seed, only), sys.stdout)
+        return
+
+    results = []
+    for rows in [int(size) for size in args.sizes.split(',')]:
+        command = [sys.executable, __file__, '--worker', str(rows), '--repeat', str(args.repeat),
+                   '--seed', str(args.seed), '--only', args.only]
+        completed = subprocess.run(command, check=True, stdout=subprocess.PIPE, text=True)
+        results.append(json.loads(completed.stdout))
+
+    print_summary(results)
+    if args.output:
+        report = {
+            'meta': {
+                'repeat': args.repeat,
+                'seed': args.seed,
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'cpus': os.cpu_count(),
+                'started': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            },
+            'results': results,
+        }
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f'\nResults written to {args.output}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""
+JSON Serialization Benchmark
+============================
+Times /api/users (row objects and columnar) and the insight endpoints with
+the standard library JSON encoder and with the orjson-backed provider.
+
+The bundled sample data is replicated to the requested number of rows in a
+temporary folder, so the benchmark never touches data/ or uploads/.
+
+Usage: python benchmarks/bench_serialization.py [--rows 200000] [--repeat 5]
+"""
+
+import argparse
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import app as backend  # noqa: E402
+
+SAMPLE_PATH = ROOT / 'public' / 'data' / 'mobile_usage.csv'
+
+ENDPOINTS = [
+    '/api/users',
+    '/api/users?format=columns',
+    '/api/users?limit=1000',
+    '/api/stats',
+    '/api/insights/bundle',
+    '/api/insights/researcher',
+]
+
+def write_dataset(path, rows):
+    """Replicate the sample CSV to `rows` rows with unique User_IDs"""
+    sample = pd.read_csv(SAMPLE_PATH)
+    df = sample.iloc[np.arange(rows) % len(sample)].reset_index(drop=True)
+    df['User_ID'] = np.arange(1, rows + 1)
+    df.to_csv(path, index=False)
+
+def time_endpoint(client, url, repeat):
+    """Median wall time in ms and body size of GET `url`"""
+    client.get(url)  # Warm the dataset and analytics caches
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = client.get(url)
+        timings.append((time.perf_counter() - start) * 1000)
+        assert response.status_code == 200, (url, response.status_code)
+    return statistics.median(timings), len(response.data)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--rows', type=int, default=200000, help='Rows in the synthetic dataset')
+    parser.add_argument('--repeat', type=int, default=5, help='Timed requests per endpoint')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        backend.DATA_PATH = Path(tmp) / 'mobile_usage.csv'
+        write_dataset(backend.DATA_PATH, args.rows)
+        client = backend.app.test_client()
+
+        fast = backend.orjson
+        backends = [('stdlib', None)] + ([('orjson', fast)] if fast is not None else [])
+        results = {}
+        for name, module in backends:
+            backend.orjson = module
+            results[name] = {url: time_endpoint(client, url, args.repeat) for url in ENDPOINTS}
+        backend.orjson = fast
+
+    print(f'{args.rows} rows, median of {args.repeat} requests')
+    header = f'{"endpoint":<28}{"bytes":>12}' + ''.join(f'{name + " ms":>14}' for name, _ in backends)
+    if fast is not None:
+        header += f'{"speedup":>10}'
+    print(header)
+    for url in ENDPOINTS:
+        line = f'{url:<28}{results["stdlib"][url][1]:>12}'
+        line += ''.join(f'{results[name][url][0]:>14.1f}' for name, _ in backends)
+        if fast is not None:
+            line += f'{results["stdlib"][url][0] / results["orjson"][url][0]:>9.1f}x'
+        print(line)
+    if fast is None:
+        print('orjson is not installed; only the stdlib encoder was measured')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+Synthetic Dataset Generator
+===========================
+Writes a mobile usage CSV with the same columns as data/mobile_usage.csv and
+distributions modelled on it: each user draws a behavior class, and usage,
+screen time, battery drain, apps installed and data usage fall in that
+class's band. Output is fully determined by the seed, and rows are written in
+chunks so 10M+ row files never have to fit in memory.
+
+Usage: python benchmarks/generate_dataset.py out.csv [--rows 1000000] [--seed 42]
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+CHUNK_ROWS = 1000000  # Rows generated and written per chunk
+
+DEVICES = ['Google Pixel 5', 'OnePlus 9', 'Samsung Galaxy S21', 'Xiaomi Mi 11', 'iPhone 12']
+DEVICE_WEIGHTS = [0.2, 0.19, 0.19, 0.21, 0.21]
+
+# Behavior class -> inclusive (low, high) band of each usage metric
+CLASS_BANDS = {
+    'App_Usage_Time': [(30, 90), (91, 180), (181, 300), (301, 480), (481, 600)],
+    'Screen_On_Time': [(1.0, 2.0), (2.0, 4.0), (4.0, 6.0), (6.0, 8.0), (8.1, 12.0)],
+    'Battery_Drain': [(300, 600), (601, 1200), (1201, 1800), (1801, 2400), (2401, 3000)],
+    'Number_of_Apps_Installed': [(10, 20), (21, 40), (41, 60), (61, 80), (81, 99)],
+    'Data_Usage': [(100, 300), (301, 600), (601, 1000), (1001, 1500), (1501, 2500)],
+}
+
+COLUMNS = ['User_ID', 'Device_Model', 'Operating_System', 'App_Usage_Time', 'Screen_On_Time',
+           'Battery_Drain', 'Number_of_Apps_Installed', 'Data_Usage', 'Age', 'Gender', 'User_Behavior_Class']
+
+def generate_chunk(rng, first_id, rows):
+    """One chunk of synthetic users with User_IDs starting at `first_id`"""
+    classes = rng.integers(1, 6, rows)
+    devices = np.asarray(DEVICES, dtype=object)[rng.choice(len(DEVICES), rows, p=DEVICE_WEIGHTS)]
+    columns = {
+        'User_ID': np.arange(first_id, first_id + rows),
+        'Device_Model': devices,
+        'Operating_System': np.where(devices == 'iPhone 12', 'iOS', 'Android'),
+    }
+    for col, bands in CLASS_BANDS.items():
+        low, high = np.asarray(bands, dtype=float)[classes - 1].T
+        if isinstance(bands[0][0], float):
+            columns[col] = np.round(rng.uniform(low, high), 1)
+        else:
+            columns[col] = rng.integers(low.astype(int), high.astype(int) + 1)
+    columns['Age'] = rng.integers(18, 60, rows)
+    columns['Gender'] = np.where(rng.random(rows) < 0.52, 'Male', 'Female')
+    columns['User_Behavior_Class'] = classes
+    return pd.DataFrame(columns, columns=COLUMNS)
+
+def write_dataset(path, rows, seed=42, chunk_rows=CHUNK_ROWS):
+    """Write `rows` synthetic users to a CSV at `path`"""
+    rng = np.random.default_rng(seed)
+    with open(path, 'w', newline='') as f:
+        f.write(','.join(COLUMNS) + '\n')
+        for start in range(0, rows, chunk_rows):
+            chunk = generate_chunk(rng, start + 1, min(chunk_rows, rows - start))
+            chunk.to_csv(f, index=False, header=False, lineterminator='\n')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('path', help='CSV file to write')
+    parser.add_argument('--rows', type=int, default=1000000, help='Number of users')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    write_dataset(args.path, args.rows, args.seed)
+    print(f'Wrote {args.rows} rows to {args.path} in {time.perf_counter() - start:.1f}s')
+
+if __name__ == '__main__':
+    main()